@@ -0,0 +1,123 @@
+import numpy as np
+import scipy.sparse as sp
+
+ASSOCIATION_MEASURES = ("ppmi", "jaccard", "lift")
+# 材料ごとに保持する関連度の高い隣接ノードの数
+DEFAULT_TOP_K = 100
+
+
+def association_scores(adjacency, node_counts, recipe_count, measure="ppmi"):
+    """
+    共起回数の隣接行列から、隣接ノードとの関連度を同じ非ゼロ構造のCSR行列として返す。
+    N をレシピ数、n(a) を材料 a の出現レシピ数、c(a, b) を共起回数とすると、
+      ppmi:    max(0, log(c(a, b) * N / (n(a) * n(b))))
+      lift:    c(a, b) * N / (n(a) * n(b))
+      jaccard: c(a, b) / (n(a) + n(b) - c(a, b))
+    塩や砂糖のようにどのレシピにも出てくる材料は、共起回数が多くても関連度が低くなる。
+    自己ループ（対角成分）は含めない。
+    """
+    if measure not in ASSOCIATION_MEASURES:
+        raise ValueError(f"未知の関連度です: {measure} (選択肢: {', '.join(ASSOCIATION_MEASURES)})")
+
+    adjacency = sp.csr_matrix(adjacency)
+    n = adjacency.shape[0]
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(adjacency.indptr))
+    cols = adjacency.indices.astype(np.int64)
+    counts = np.asarray(adjacency.data, dtype=np.float64)
+    node_counts = np.asarray(node_counts, dtype=np.float64)
+    count_a, count_b = node_counts[rows], node_counts[cols]
+    valid = (rows != cols) & (counts > 0) & (count_a > 0) & (count_b > 0)
+
+    scores = np.zeros(len(counts))
+    if measure == "jaccard":
+        # 同じ材料が1レシピに複数回出てくると c(a, b) が n(a) を超えることがあるため、分母は c(a, b) 以上にする
+        union = np.maximum(count_a + count_b - counts, counts)
+        scores[valid] = counts[valid] / union[valid]
+    else:
+        lift = counts[valid] * max(recipe_count, 1) / (count_a[valid] * count_b[valid])
+        scores[valid] = lift if measure == "lift" else np.maximum(np.log(lift), 0.0)
+    return rows, cols, scores
+
+
+class AssociationIndex:
+    """
+    材料ごとに関連度の高い隣接ノードを上位 top_k 件だけ、関連度の降順に並べて保持する索引。
+    CSRと同じく indptr / indices / scores の3つの配列で表し、材料 i の候補は indptr[i]:indptr[i + 1] にある。
+    推薦時は全隣接ノードではなく、クエリの短いリストを合わせるだけで済む。
+    """
+
+    ARRAYS = ("indptr", "indices", "scores")
+
+    def __init__(self, measure, indptr, indices, scores, top_k):
+        self.measure = measure
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        self.top_k = top_k
+
+    @classmethod
+    def build(cls, store, measure="ppmi", top_k=DEFAULT_TOP_K):
+        """
+        CooccurrenceStore から索引を作る。関連度が0以下の隣接ノードは含めない。
+        """
+        rows, cols, scores = association_scores(store.csr(), store.node_counts, store.number_of_recipes(),
+                                                measure)
+        positive = scores > 0
+        rows, cols, scores = rows[positive], cols[positive], scores[positive]
+        # 行ごとに関連度の降順（同点ならノードIDの小さい順）に並べ、先頭の top_k 件を残す
+        order = np.lexsort((cols, -scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        starts = np.searchsorted(rows, rows, side="left")
+        keep = (np.arange(len(rows)) - starts) < top_k
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+        n = len(store.vocabulary)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(measure, indptr, cols.astype(np.int32), scores.astype(np.float32), top_k)
+
+    @property
+    def number_of_nodes(self):
+        return len(self.indptr) - 1
+
+    def neighbors(self, index):
+        """
+        材料IDの関連度上位の (ノードIDの配列, 関連度の配列) を関連度の降順で返す。
+        """
+        if index >= self.number_of_nodes:
+            return self.indices[:0], self.scores[:0]
+        start, end = self.indptr[index], self.indptr[index + 1]
+        return self.indices[start:end], self.scores[start:end]
+
+    def recommend(self, query_ids, k):
+        """
+        クエリの各材料の上位リストを合わせ、関連度の合計が大きい順に上位k件のノードIDを返す。
+        同点の場合はノードIDの小さい順。クエリの材料自身は候補から除く。
+        """
+        if len(query_ids) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        lists = [self.neighbors(index) for index in query_ids]
+        candidates = np.concatenate([indices for indices, _ in lists]).astype(np.int64)
+        scores = np.concatenate([scores for _, scores in lists]).astype(np.float64)
+        candidates, inverse = np.unique(candidates, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores, minlength=len(candidates))
+        keep = ~np.isin(candidates, query_ids)
+        candidates, totals = candidates[keep], totals[keep]
+        order = np.lexsort((candidates, -totals))[:k]
+        return candidates[order], totals[order]
+
+    def arrays(self):
+        return {"indptr": self.indptr, "indices": self.indices, "scores": self.scores}
+
+    @classmethod
+    def from_arrays(cls, measure, arrays, top_k):
+        return cls(measure, arrays["indptr"], arrays["indices"], arrays["scores"], top_k)
+
+    def __repr__(self):
+        return (f"AssociationIndex(measure={self.measure!r}, top_k={self.top_k}, "
+                f"nodes={self.number_of_nodes}, entries={len(self.indices)})")
+
+
+def build_association_indexes(store, measures=ASSOCIATION_MEASURES, top_k=DEFAULT_TOP_K):
+    # 指定した関連度ごとの索引を {関連度: AssociationIndex} として作る
+    return {measure: AssociationIndex.build(store, measure, top_k) for measure in measures}
@@ -0,0 +1,144 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from translator_backends import RetryableTranslationError, TranslationError
+
+
+class TokenBucket:
+    """
+    トークンバケット方式のレート制限。1秒あたり rate 個のトークンが補充され、最大 capacity 個まで溜まる。
+    リクエストの前に acquire() でトークンを1つ消費し、足りなければ補充されるまで待つ。
+    トークンはスレッドのロックで守るため、複数のイベントループ（スレッド）から同じバケットを使える。
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate は正の数でなければなりません。")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _take(self):
+        # トークンを1つ消費して0を、足りなければ補充されるまでの秒数を返す
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        # 待たずにトークンを1つ消費する。足りなければ False
+        return self._take() == 0.0
+
+    async def acquire(self):
+        while True:
+            wait = self._take()
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
+
+
+class AsyncTranslationPipeline:
+    """
+    ブロッキングな翻訳関数 translate(text) を、同時実行数とレートを制限しながら並行に呼び出すパイプライン。
+    - 同じ文字列は1度だけ翻訳する
+    - 同時に実行する翻訳は concurrency 件まで、開始は1秒あたり rate 件まで（トークンバケット）。
+      バケットはパイプラインごとに1つで、translate_all を何度呼び出しても共有する。
+      rate はこのプロセスでの上限なので、複数のプロセスで翻訳する場合は per_process_options で分割する
+    - RetryableTranslationError（429や一時的な通信エラー）は指数バックオフとジッタを入れて max_retries 回まで再試行する。
+      サーバが Retry-After を返した場合はその時間以上待つ
+    - 結果は入力と同じ順序のリストで返し、失敗した要素は TranslationError になる
+    """
+
+    def __init__(self, translate, concurrency=8, rate=5.0, burst=None, max_retries=5, backoff=0.5,
+                 max_backoff=30.0):
+        self.translate = translate
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # 翻訳の試行・再試行・レート制限（429）などの件数
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def take_stats(self):
+        # 前回呼び出してからの件数を返してリセットする
+        with self._stats_lock:
+            stats, self.stats = dict(self.stats), Counter()
+        return stats
+
+    def backoff_delay(self, attempt, retry_after=None):
+        # 指数バックオフ（上限 max_backoff）に 50〜100% のジッタを掛ける
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt)) * (0.5 + random.random() / 2)
+        return max(delay, retry_after or 0.0)
+
+    async def translate_one(self, text, executor):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self.count("requests")
+            try:
+                return await loop.run_in_executor(executor, self.translate, text)
+            except RetryableTranslationError as e:
+                if e.status == 429:
+                    self.count("rate_limited")
+                if attempt == self.max_retries:
+                    return e
+                self.count("retries")
+                await asyncio.sleep(self.backoff_delay(attempt, e.retry_after))
+            except TranslationError as e:
+                return e
+
+    async def translate_all(self, texts):
+        """
+        texts を翻訳し、入力と同じ順序のリストを返す。
+        """
+        unique = list(dict.fromkeys(texts))
+        results = {}
+        queue = asyncio.Queue()
+        for text in unique:
+            queue.put_nowait(text)
+
+        async def worker(executor):
+            while True:
+                try:
+                    text = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results[text] = await self.translate_one(text, executor)
+
+        workers = min(self.concurrency, len(unique))
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translation") as executor:
+                await asyncio.gather(*(worker(executor) for _ in range(workers)))
+        return [results[text] for text in texts]
+
+    def run(self, texts):
+        """
+        同期的なコードから呼び出す。すでにイベントループが動いているスレッドからは別スレッドで実行する。
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.translate_all(list(texts)))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.translate_all(list(texts))).result()
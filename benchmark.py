@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from cache_settings import CACHE_ROOT_ENV
+from import_check import check_startup, measure_startup
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+RECOMMENDATION_MODES = ("default", "cooccurring", "ppmi")
+
+
+def latency_summary(seconds):
+    # 1回あたりの処理時間（秒）のリストから、ミリ秒のパーセンタイルとQPSを求める
+    seconds = np.asarray(seconds)
+    return {
+        "p50_ms": float(np.percentile(seconds, 50) * 1000),
+        "p95_ms": float(np.percentile(seconds, 95) * 1000),
+        "p99_ms": float(np.percentile(seconds, 99) * 1000),
+        "qps": float(len(seconds) / seconds.sum()) if seconds.sum() > 0 else float("inf"),
+    }
+
+
+def peak_memory_mb():
+    # このプロセスと、終了した子プロセス（並列構築のワーカー）の最大RSS（Linuxの ru_maxrss はKB単位）
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"process": own / scale, "workers": children / scale}
+
+
+def measure_size(options, cache_root):
+    """
+    合成レシピ options.recipes 件でグラフを構築し、構築・キャッシュ読み込み・推薦の性能を測る。
+    """
+    # 翻訳キャッシュは cache_root に作られる。プロファイルなどの既定の出力先も一時ディレクトリにする
+    os.environ[CACHE_ROOT_ENV] = cache_root
+    from creategraph import CreateGraph
+    from graphAnalyzer import GraphAnalyzer
+    from synthetic_recipes import SyntheticRecipeLoader
+    from tokenizer import create_tokenizer
+    from unionization_tmp import Unionization
+
+    loader = SyntheticRecipeLoader(number_of_recipes=options.recipes, vocabulary_size=options.vocabulary,
+                                   min_ingredients=options.min_ingredients,
+                                   max_ingredients=options.max_ingredients,
+                                   zipf_exponent=options.zipf, seed=options.seed)
+    graph_options = {
+        "translator_backend": "identity",
+        "tokenizer": "whitespace",
+        "workers": options.workers,
+        "chunk_size": options.chunk_size,
+        "number_of_recipes": options.recipes,
+        "cache_root": cache_root,
+        "streaming": True,
+    }
+    result = {"recipes": options.recipes}
+
+    # 材料の正規化だけの処理速度（スタブの正規化で、正規化以外のオーバーヘッドを測る）
+    sample = [recipe.get_ingredients()
+              for recipe, _ in zip(loader.load_all_recipes(), range(min(options.recipes, 10000)))]
+    unionization = Unionization(backend="identity", tokenizer=create_tokenizer("whitespace"))
+    started = time.perf_counter()
+    unionization.translate_recipes(sample)
+    elapsed = time.perf_counter() - started
+    result["normalize_recipes_per_second"] = len(sample) / elapsed if elapsed > 0 else float("inf")
+
+    # グラフの構築（キャッシュなし）
+    builder = CreateGraph(recipe_loader=loader, **graph_options)
+    started = time.perf_counter()
+    builder.build_graph()
+    elapsed = time.perf_counter() - started
+    result["build_seconds"] = elapsed
+    result["build_recipes_per_second"] = options.recipes / elapsed if elapsed > 0 else float("inf")
+    result["nodes"] = int(len(builder.store.active_nodes()))
+    result["edges"] = builder.store.number_of_edges()
+    result["peak_memory_mb"] = peak_memory_mb()
+
+    # グラフキャッシュの読み込み
+    load_times = []
+    for _ in range(options.loads):
+        cached = CreateGraph(**graph_options)
+        started = time.perf_counter()
+        cached.build_graph()
+        load_times.append(time.perf_counter() - started)
+    result["cache_load_ms"] = float(np.median(load_times) * 1000)
+
+    # コミュニティと中心性の計算（グラフのバージョンごとに1度だけ）
+    analyzer = GraphAnalyzer.from_graph_builder(cached, community_algorithm=options.community_algorithm)
+    started = time.perf_counter()
+    analyzer.ensure_analysis()
+    result["analysis_seconds"] = time.perf_counter() - started
+    result["modularity"] = analyzer.community_result.modularity
+
+    # 推薦のレイテンシ（1件ずつ）とバッチ処理のスループット
+    queries = loader.sample_queries(options.queries)
+    recommenders = {
+        "default": analyzer.recommend_ingredients,
+        "cooccurring": analyzer.recommend_cooccurring_ingredients,
+        "ppmi": analyzer.recommend_associated_ingredients,
+    }
+    result["latency"] = {}
+    for mode in RECOMMENDATION_MODES:
+        recommend = recommenders[mode]
+        recommend(queries[0], options.top_n)  # 初回のみの準備（スコア計算エンジンの構築など）を除く
+        seconds = []
+        for query in queries:
+            started = time.perf_counter()
+            recommend(query, options.top_n)
+            seconds.append(time.perf_counter() - started)
+        result["latency"][mode] = latency_summary(seconds)
+
+    started = time.perf_counter()
+    analyzer.recommend_ingredients_batch(queries, options.top_n)
+    elapsed = time.perf_counter() - started
+    result["batch_qps"] = len(queries) / elapsed if elapsed > 0 else float("inf")
+    result["peak_memory_mb"]["total"] = peak_memory_mb()["process"]
+    return result
+
+
+def run_size_in_subprocess(options, recipes):
+    # サイズごとに別プロセスで測り、最大メモリ使用量が前のサイズの影響を受けないようにする
+    cache_root = tempfile.mkdtemp(prefix=f"recipe-benchmark-{recipes}-", dir=options.work_dir)
+    result_path = os.path.join(cache_root, "result.json")
+    argv = [sys.executable, os.path.abspath(__file__), "--run-size", str(recipes), "--result", result_path,
+            "--cache-root", cache_root]
+    for name in ("vocabulary", "min_ingredients", "max_ingredients", "zipf", "seed", "workers", "chunk_size",
+                 "loads", "queries", "top_n", "community_algorithm"):
+        argv += [f"--{name.replace('_', '-')}", str(getattr(options, name))]
+    try:
+        subprocess.run(argv, check=True, stdout=subprocess.DEVNULL if not options.verbose else None)
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        if not options.keep:
+            shutil.rmtree(cache_root, ignore_errors=True)
+
+
+def print_report(report):
+    startup = report["startup"]
+    print(f"Startup: import {startup['import_ms']:.1f} ms, wall {startup['wall_ms']:.1f} ms, "
+          f"heavy modules: {startup['heavy_modules'] or 'none'}")
+    for name, ms in startup["top_modules_ms"].items():
+        print(f"  {name:<30} {ms:8.1f} ms")
+    print()
+    header = (f"{'recipes':>9} {'nodes':>7} {'edges':>10} {'build s':>9} {'recipes/s':>10} {'peak MB':>8} "
+              f"{'load ms':>8} {'analysis s':>10} " + " ".join(f"{mode + ' p50/p99 ms':>22}" for mode in RECOMMENDATION_MODES)
+              + f" {'batch qps':>10}")
+    print(header)
+    for result in report["results"]:
+        latency = " ".join(f"{result['latency'][mode]['p50_ms']:>10.3f}/{result['latency'][mode]['p99_ms']:<11.3f}"
+                           for mode in RECOMMENDATION_MODES)
+        print(f"{result['recipes']:>9} {result['nodes']:>7} {result['edges']:>10} {result['build_seconds']:>9.2f} "
+              f"{result['build_recipes_per_second']:>10.0f} {result['peak_memory_mb']['total']:>8.0f} "
+              f"{result['cache_load_ms']:>8.2f} {result['analysis_seconds']:>10.2f} {latency} "
+              f"{result['batch_qps']:>10.0f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="合成レシピでグラフ構築・キャッシュ読み込み・推薦の性能を測るベンチマーク")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="測定するレシピ数（カンマ区切り）")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="材料の種類数")
+    parser.add_argument("--min-ingredients", type=int, default=3, help="1レシピの最小材料数")
+    parser.add_argument("--max-ingredients", type=int, default=12, help="1レシピの最大材料数")
+    parser.add_argument("--zipf", type=float, default=1.1, help="材料の出現頻度のZipf指数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="グラフ構築のプロセス数")
+    parser.add_argument("--chunk-size", type=int, default=500, help="1タスクあたりのレシピ数")
+    parser.add_argument("--loads", type=int, default=5, help="キャッシュ読み込みの測定回数")
+    parser.add_argument("--queries", type=int, default=1000, help="推薦の測定に使うクエリ数")
+    parser.add_argument("--top-n", type=int, default=10, help="1クエリあたりの推薦数")
+    parser.add_argument("--community-algorithm", default="louvain", help="コミュニティ検出のアルゴリズム")
+    parser.add_argument("--work-dir", help="キャッシュを作る一時ディレクトリの場所")
+    parser.add_argument("--keep", action="store_true", help="測定後にキャッシュを削除しない")
+    parser.add_argument("--verbose", action="store_true", help="グラフ構築の進捗を表示する")
+    parser.add_argument("--output", help="結果をJSONで保存するファイル")
+    parser.add_argument("--max-import-ms", type=float,
+                        help="起動時のimport時間の上限。超えた場合や重いモジュールが読み込まれた場合は終了コード1")
+    # 内部用: 1つのサイズだけを測定して結果をファイルに書く
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--cache-root", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.run_size is not None:
+        options.recipes = options.run_size
+        result = measure_size(options, options.cache_root)
+        with open(options.result, mode="w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    report = {"startup": measure_startup(), "results": []}
+    for recipes in (int(size) for size in options.sizes.split(",") if size):
+        print(f"Measuring {recipes} recipes...", file=sys.stderr)
+        report["results"].append(run_size_in_subprocess(options, recipes))
+    print_report(report)
+
+    if options.output:
+        with open(options.output, mode="w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if options.max_import_ms is not None:
+        problems = check_startup(report["startup"], options.max_import_ms)
+        for problem in problems:
+            print(f"Startup regression: {problem}", file=sys.stderr)
+        if problems:
+            return 1
+    return 0
+
+
+# 使い方:
+# python benchmark.py --sizes 1000,10000,100000 --output benchmark.json
+# python benchmark.py --sizes 1000 --max-import-ms 500  # 起動時間の回帰チェック
+if __name__ == "__main__":
+    sys.exit(main())
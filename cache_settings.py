@@ -0,0 +1,9 @@
+import os
+
+# キャッシュのルートディレクトリ（環境変数 RECIPE_CACHE_ROOT で変更できる）
+CACHE_ROOT_ENV = "RECIPE_CACHE_ROOT"
+DEFAULT_CACHE_ROOT = "/home/group1/app/cash"
+
+
+def default_cache_root():
+    return os.environ.get(CACHE_ROOT_ENV, DEFAULT_CACHE_ROOT)
@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+COMMUNITY_ALGORITHMS = ("louvain", "leiden", "label_propagation")
+
+
+class CommunityResult:
+    """
+    コミュニティ検出の結果。labels はノードIDごとのコミュニティID（グラフに存在しないノードは -1）。
+    """
+
+    def __init__(self, labels, algorithm, seed, modularity, elapsed):
+        self.labels = labels
+        self.algorithm = algorithm
+        self.seed = seed
+        self.modularity = modularity
+        self.elapsed = elapsed
+
+    def groups(self):
+        """
+        コミュニティごとのノードIDの配列を、大きいコミュニティから順に返す。
+        """
+        nodes = np.flatnonzero(self.labels >= 0)
+        order = np.argsort(self.labels[nodes], kind="stable")
+        nodes = nodes[order]
+        boundaries = np.flatnonzero(np.diff(self.labels[nodes])) + 1
+        groups = np.split(nodes, boundaries) if len(nodes) else []
+        return sorted(groups, key=len, reverse=True)
+
+    def __repr__(self):
+        return (f"CommunityResult(algorithm={self.algorithm!r}, communities={len(self.groups())}, "
+                f"modularity={self.modularity:.4f}, elapsed={self.elapsed:.3f}s)")
+
+
+def csr_edges(adjacency):
+    # CSR行列の (行, 列, 重み)。グラフキャッシュの行列は indices と indptr の型が異なるため tocoo は使わない
+    adjacency = sp.csr_matrix(adjacency)
+    rows = np.repeat(np.arange(adjacency.shape[0], dtype=np.int64), np.diff(adjacency.indptr))
+    return rows, adjacency.indices.astype(np.int64), adjacency.data
+
+
+def modularity(adjacency, labels):
+    """
+    重み付きグラフのモジュラリティを計算する（networkx.community.modularity と同じ定義）。
+    自己ループは次数に2回、コミュニティ内の重みに1回数える。
+    """
+    rows, cols, data = csr_edges(adjacency)
+    off_diagonal = rows != cols
+    strength = np.bincount(rows, weights=data, minlength=len(labels)) + np.bincount(
+        rows[~off_diagonal], weights=data[~off_diagonal], minlength=len(labels))
+    total = strength.sum() / 2
+    if total == 0:
+        return 0.0
+
+    active = labels >= 0
+    same = (labels[rows] == labels[cols]) & active[rows]
+    internal = data[same & off_diagonal].sum() / 2 + data[same & ~off_diagonal].sum()
+    community_strength = np.bincount(labels[active], weights=strength[active])
+    return float(internal / total - ((community_strength / (2 * total)) ** 2).sum())
+
+
+def _active_subgraph(adjacency, active_nodes):
+    # 出現するノードだけの隣接行列（ノードは active_nodes の順に0から振り直す）
+    rows, cols, data = csr_edges(adjacency)
+    positions = np.full(adjacency.shape[0], -1, dtype=np.int64)
+    positions[active_nodes] = np.arange(len(active_nodes))
+    keep = (positions[rows] >= 0) & (positions[cols] >= 0)
+    n = len(active_nodes)
+    return sp.csr_matrix((data[keep], (positions[rows[keep]], positions[cols[keep]])), shape=(n, n))
+
+
+def _louvain(adjacency, seed):
+    import community as community_louvain
+    import networkx as nx
+
+    graph = nx.from_scipy_sparse_array(adjacency, edge_attribute="weight")
+    partition = community_louvain.best_partition(graph, weight="weight", random_state=seed)
+    return np.fromiter((partition[node] for node in range(adjacency.shape[0])), dtype=np.int64,
+                       count=adjacency.shape[0])
+
+
+def _leiden(adjacency, seed):
+    try:
+        import igraph as ig
+        import leidenalg
+    except ImportError as e:
+        raise ImportError("Leiden法には python-igraph と leidenalg が必要です。") from e
+
+    rows, cols, data = csr_edges(adjacency)
+    upper = rows <= cols
+    graph = ig.Graph(n=adjacency.shape[0], edges=list(zip(rows[upper].tolist(), cols[upper].tolist())))
+    partition = leidenalg.find_partition(graph, leidenalg.ModularityVertexPartition,
+                                         weights=data[upper].tolist(), seed=seed)
+    return np.asarray(partition.membership, dtype=np.int64)
+
+
+def _label_propagation(adjacency, seed, max_iterations=100):
+    """
+    重み付きのラベル伝播法。各ノードは隣接ノードのラベルのうち重みの合計が最大のものを選ぶ。
+    全ノードの更新をNumPyでまとめて計算し、振動しないよう毎回ランダムに半分のノードだけを更新する。
+    """
+    rng = np.random.default_rng(seed)
+    n = adjacency.shape[0]
+    rows, cols, weights = csr_edges(adjacency)
+    off_diagonal = rows != cols
+    rows, cols = rows[off_diagonal], cols[off_diagonal]
+    weights = weights[off_diagonal].astype(np.float64)
+    labels = np.arange(n, dtype=np.int64)
+    for _ in range(max_iterations):
+        # (ノード, 隣接ノードのラベル) ごとの重みの合計
+        neighbor_labels = labels[cols]
+        keys, inverse = np.unique(rows * n + neighbor_labels, return_inverse=True)
+        label_weights = np.bincount(inverse, weights=weights)
+        key_rows, key_labels = keys // n, keys % n
+        # ノードごとに重みが最大のラベル（同点ならラベルの小さい方）を選ぶ
+        order = np.lexsort((key_labels, -label_weights, key_rows))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = key_rows[order][1:] != key_rows[order][:-1]
+        best_rows = key_rows[order][first]
+        best_labels = labels.copy()
+        best_labels[best_rows] = key_labels[order][first]
+        best_weights = np.zeros(n)
+        best_weights[best_rows] = label_weights[order][first]
+        current_weights = np.bincount(rows, weights=weights * (neighbor_labels == labels[rows]), minlength=n)
+
+        improvable = best_weights > current_weights
+        if not improvable.any():
+            break
+        update = improvable & (rng.random(n) < 0.5)
+        labels[update] = best_labels[update]
+    # ラベルを0から振り直す
+    return np.unique(labels, return_inverse=True)[1].astype(np.int64)
+
+
+def detect_communities(adjacency, active_nodes, algorithm="louvain", seed=42):
+    """
+    重み付きの隣接行列からコミュニティを検出する。
+    adjacency はノードID順の対称なCSR行列、active_nodes はグラフに存在するノードIDの配列。
+    """
+    detectors = {
+        "louvain": _louvain,
+        "leiden": _leiden,
+        "label_propagation": _label_propagation,
+    }
+    if algorithm not in detectors:
+        raise ValueError(f"未知のコミュニティ検出アルゴリズムです: {algorithm} (選択肢: {', '.join(COMMUNITY_ALGORITHMS)})")
+
+    started = time.perf_counter()
+    labels = np.full(adjacency.shape[0], -1, dtype=np.int64)
+    active_nodes = np.asarray(active_nodes, dtype=np.int64)
+    if len(active_nodes):
+        labels[active_nodes] = detectors[algorithm](_active_subgraph(adjacency, active_nodes), seed)
+    elapsed = time.perf_counter() - started
+    return CommunityResult(labels, algorithm, seed, modularity(adjacency, labels), elapsed)
@@ -0,0 +1,290 @@
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class Vocabulary:
+    """
+    材料名と整数IDの対応表。IDは最初に出現した順に振られ、削除されても再利用しない。
+    """
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        # 未登録の材料名なら新しいIDを割り当てる
+        index = self.ids.get(name)
+        if index is None:
+            index = len(self.names)
+            self.ids[name] = index
+            self.names.append(name)
+        return index
+
+    def get(self, name, default=None):
+        return self.ids.get(name, default)
+
+    def lookup(self, names):
+        # グラフに存在しない材料は無視してIDのリストを返す
+        return [self.ids[name] for name in names if name in self.ids]
+
+    def __getitem__(self, index):
+        return self.names[index]
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+class CooccurrenceStore:
+    """
+    材料の共起回数を保持するコンパクトなデータ構造。
+    材料ペア (i, j) (i <= j) を1つのint64キーに詰め、ソート済みのキー配列と回数配列で管理する。
+    NetworkXのグラフや隣接行列は必要になったときにここから作る。
+    """
+
+    PAIR_SHIFT = 32
+    PAIR_MASK = (1 << PAIR_SHIFT) - 1
+    # 差分配列がこの数だけ溜まったら配列に反映してメモリを抑える
+    MAX_PENDING_ARRAYS = 32
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary or Vocabulary()
+        # ソート済みのペアキーと共起回数
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        # 材料ごとの出現レシピ数（IDで引く）
+        self.node_counts = np.empty(0, dtype=np.int64)
+        # 追加したレシピの総数（PMIなどの確率の分母）
+        self.recipe_count = 0
+        # まだ配列に反映していない差分
+        self._pending_pairs = Counter()
+        self._pending_nodes = Counter()
+        self._pending_arrays = []
+        self._csr = None
+
+    @classmethod
+    def pack(cls, i, j):
+        return (i << cls.PAIR_SHIFT) | j if i <= j else (j << cls.PAIR_SHIFT) | i
+
+    @classmethod
+    def unpack(cls, keys):
+        return keys >> cls.PAIR_SHIFT, keys & cls.PAIR_MASK
+
+    def add_recipe(self, names, sign=1):
+        """
+        1レシピ分の正規化済み材料名を追加する。sign に -1 を指定すると寄与を差し引く。
+        """
+        self._ensure_keys()
+        self.recipe_count += sign
+        ids = [self.vocabulary.add(name) for name in names]
+        for index in dict.fromkeys(ids):
+            self._pending_nodes[index] += sign
+        pending_pairs = self._pending_pairs
+        for i in range(len(ids) - 1):
+            a = ids[i]
+            for b in ids[i + 1:]:
+                pending_pairs[(a << self.PAIR_SHIFT) | b if a <= b else (b << self.PAIR_SHIFT) | a] += sign
+        self._csr = None
+
+    def merge(self, other, sign=1):
+        """
+        別のストア（ワーカーの部分結果など）の回数を加算する。語彙が異なっていてもよい。
+        """
+        self._ensure_keys()
+        other.compact()
+        self.recipe_count += sign * other.recipe_count
+        mapping = np.fromiter((self.vocabulary.add(name) for name in other.vocabulary.names),
+                              dtype=np.int64, count=len(other.vocabulary))
+        if len(other.node_counts):
+            node_ids = np.flatnonzero(other.node_counts)
+            self._pending_nodes.update(dict(zip(mapping[node_ids].tolist(),
+                                                (sign * other.node_counts[node_ids]).tolist())))
+        if len(other.keys):
+            src, dst = other.unpack(other.keys)
+            src, dst = mapping[src], mapping[dst]
+            keys = (np.minimum(src, dst) << self.PAIR_SHIFT) | np.maximum(src, dst)
+            self._pending_arrays.append((keys, sign * other.counts))
+        self._csr = None
+        if len(self._pending_arrays) >= self.MAX_PENDING_ARRAYS:
+            self.compact()
+
+    def compact(self):
+        """
+        溜まっている差分をソート済み配列に反映する。回数が0以下になったペアは取り除く。
+        """
+        if not (self._pending_pairs or self._pending_nodes or self._pending_arrays):
+            if len(self.node_counts) < len(self.vocabulary):
+                self.node_counts = np.pad(self.node_counts, (0, len(self.vocabulary) - len(self.node_counts)))
+            return
+
+        self._ensure_keys()
+        key_parts = [self.keys]
+        count_parts = [self.counts]
+        if self._pending_pairs:
+            key_parts.append(np.fromiter(self._pending_pairs.keys(), dtype=np.int64, count=len(self._pending_pairs)))
+            count_parts.append(np.fromiter(self._pending_pairs.values(), dtype=np.int64,
+                                           count=len(self._pending_pairs)))
+        for keys, counts in self._pending_arrays:
+            key_parts.append(keys)
+            count_parts.append(counts)
+        keys, inverse = np.unique(np.concatenate(key_parts), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate(count_parts), minlength=len(keys)).astype(np.int64)
+        alive = counts > 0
+        self.keys, self.counts = keys[alive], counts[alive]
+
+        node_counts = np.zeros(len(self.vocabulary), dtype=np.int64)
+        node_counts[:len(self.node_counts)] = self.node_counts
+        if self._pending_nodes:
+            node_ids = np.fromiter(self._pending_nodes.keys(), dtype=np.int64, count=len(self._pending_nodes))
+            deltas = np.fromiter(self._pending_nodes.values(), dtype=np.int64, count=len(self._pending_nodes))
+            np.add.at(node_counts, node_ids, deltas)
+        self.node_counts = np.maximum(node_counts, 0)
+
+        self._pending_pairs = Counter()
+        self._pending_nodes = Counter()
+        self._pending_arrays = []
+        self._csr = None
+
+    def _ensure_keys(self):
+        # キャッシュから隣接行列だけを読み込んだ場合は、上三角成分からペアキーを復元する
+        if self.keys is None:
+            upper = sp.triu(self._csr, format="coo")
+            order = np.lexsort((upper.col, upper.row))
+            rows, cols = upper.row[order].astype(np.int64), upper.col[order].astype(np.int64)
+            self.keys = (rows << self.PAIR_SHIFT) | cols
+            self.counts = np.asarray(upper.data[order], dtype=np.int64)
+
+    def csr(self):
+        """
+        対称な重み付き隣接行列（scipy.sparse.csr_matrix）を返す。自己ループは対角成分に1度だけ入る。
+        """
+        if self._csr is None:
+            self.compact()
+            n = len(self.vocabulary)
+            src, dst = self.unpack(self.keys)
+            off_diagonal = src != dst
+            rows = np.concatenate([src, dst[off_diagonal]])
+            cols = np.concatenate([dst, src[off_diagonal]])
+            weights = np.concatenate([self.counts, self.counts[off_diagonal]])
+            csr = sp.csr_matrix((weights, (rows, cols)), shape=(n, n))
+            csr.indices = csr.indices.astype(np.int32, copy=False)
+            csr.indptr = csr.indptr.astype(np.int64, copy=False)
+            csr.sort_indices()
+            self._csr = csr
+        return self._csr
+
+    def number_of_edges(self):
+        self.compact()
+        self._ensure_keys()
+        return len(self.keys)
+
+    def active_nodes(self):
+        # 1件以上のレシピに出現する材料のID
+        self.compact()
+        return np.flatnonzero(self.node_counts)
+
+    def weight(self, a, b):
+        """
+        2つの材料の共起回数を返す。共起していない場合は0。
+        """
+        i, j = self.vocabulary.get(a), self.vocabulary.get(b)
+        if i is None or j is None:
+            return 0
+        self.compact()
+        self._ensure_keys()
+        key = self.pack(i, j)
+        position = np.searchsorted(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return int(self.counts[position])
+        return 0
+
+    def row(self, name):
+        """
+        材料の隣接ノードと共起回数を {材料名: 回数} で返す。
+        """
+        index = self.vocabulary.get(name)
+        if index is None:
+            return {}
+        matrix = self.csr()
+        start, end = matrix.indptr[index], matrix.indptr[index + 1]
+        return {self.vocabulary[neighbor]: int(weight)
+                for neighbor, weight in zip(matrix.indices[start:end], matrix.data[start:end])}
+
+    def iter_edges(self):
+        # (材料名, 材料名, 共起回数) を順に返す
+        self.compact()
+        self._ensure_keys()
+        names = self.vocabulary.names
+        src, dst = self.unpack(self.keys)
+        for i, j, count in zip(src.tolist(), dst.tolist(), self.counts.tolist()):
+            yield names[i], names[j], count
+
+    def edge_weights(self):
+        # 従来の {(材料名, 材料名): 回数} 形式の辞書に変換する（キーはソート済み）
+        return {(a, b) if a <= b else (b, a): count for a, b, count in self.iter_edges()}
+
+    def to_networkx(self):
+        """
+        重み付きのNetworkXグラフを作る。
+        """
+        import networkx as nx
+
+        G = nx.Graph()
+        names = self.vocabulary.names
+        G.add_nodes_from(names[index] for index in self.active_nodes().tolist())
+        G.add_weighted_edges_from(self.iter_edges())
+        return G
+
+    @classmethod
+    def from_csr(cls, vocabulary, csr, node_counts, recipe_count=0):
+        """
+        語彙・対称な隣接行列・出現レシピ数から作る。ペアキーは必要になるまで復元しない。
+        メモリマップした配列を渡せば、隣接行列はコピーせずにそのまま使う。
+        """
+        store = cls(vocabulary)
+        store.keys = None
+        store.counts = None
+        store.node_counts = node_counts
+        store.recipe_count = recipe_count
+        store._csr = csr
+        return store
+
+    @classmethod
+    def from_edge_weights(cls, nodes, edge_weights):
+        """
+        従来の (ノード, {(材料名, 材料名): 回数}) から作る。出現レシピ数は不明なため各材料1件とみなす。
+        """
+        store = cls(Vocabulary(nodes))
+        store._pending_nodes.update(dict.fromkeys(range(len(store.vocabulary)), 1))
+        for (a, b), count in edge_weights.items():
+            i, j = store.vocabulary.add(a), store.vocabulary.add(b)
+            store._pending_pairs[store.pack(i, j)] += count
+        store.compact()
+        return store
+
+    def number_of_recipes(self):
+        """
+        レシピの総数。総数を記録していない古いキャッシュでは、出現レシピ数の合計を上限として使う。
+        """
+        self.compact()
+        return int(self.recipe_count or self.node_counts.sum())
+
+    def __getstate__(self):
+        # 差分を反映してから保存する
+        self.compact()
+        self._ensure_keys()
+        state = self.__dict__.copy()
+        state["_csr"] = None
+        state["node_counts"] = np.asarray(self.node_counts)
+        return state
+
+    def __setstate__(self, state):
+        # レシピの総数を持たない以前のキャッシュも読み込めるようにする
+        state.setdefault("recipe_count", 0)
+        self.__dict__.update(state)
@@ -1,35 +1,149 @@
-from pyvis.network import Network
-import networkx as nx
 import pickle
-from tqdm import tqdm
-from cookpad.recipe_loader import RecipeLoader
+import json
 import os
-from unionization_tmp import Unionization
+import sys
+import itertools
+import time
+from collections import Counter, deque
+from translator_backends import create_translator_backend, per_process_options
+from cooccurrence import CooccurrenceStore
+from cache_settings import default_cache_root
+from graph_cache import GraphCache, StaleCacheError, combine_digests, recipe_digest
+from association import ASSOCIATION_MEASURES, DEFAULT_TOP_K, build_association_indexes
+from metrics import Metrics, get_default_metrics, profiled
+
+
+def process_recipe_chunk(unionization, recipes):
+    """
+    (レシピID, 材料リスト) のチャンクを正規化し、部分的な共起カウントを返す。
+    チャンクの処理時間や件数は Metrics の snapshot() として返し、呼び出し側で集計する。
+    """
+    metrics = Metrics()
+    unionization.metrics = metrics
+    cache = unionization.cache
+    before = (cache.memory_hits, cache.disk_hits, cache.misses)
+    with metrics.stage("build.normalize"):
+        translated = unionization.translate_recipes([ingredients for _, ingredients in recipes])
+    recipe_names = [(recipe_id, tuple(name for name, _ in ingredients))
+                    for (recipe_id, _), ingredients in zip(recipes, translated)]
+    with metrics.stage("build.count_pairs"):
+        store = CooccurrenceStore()
+        for _, names in recipe_names:
+            store.add_recipe(names)
+        store.compact()
+    metrics.increment("recipes_processed", len(recipes))
+    metrics.increment("pairs_counted", sum(len(names) * (len(names) - 1) // 2 for _, names in recipe_names))
+    metrics.increment("translation_cache_memory_hits", cache.memory_hits - before[0])
+    metrics.increment("translation_cache_disk_hits", cache.disk_hits - before[1])
+    metrics.increment("translation_cache_misses", cache.misses - before[2])
+    return recipe_names, store, dict(unionization.failures), metrics.snapshot()
+
+
+def get_recipe_id(recipe, index):
+    # レシピIDを取得する（属性がない場合は読み込み順の番号で代用）
+    for attr in ("recipe_id", "id"):
+        recipe_id = getattr(recipe, attr, None)
+        if recipe_id is not None:
+            return recipe_id
+    return index
+
+
+def bounded_map(executor, fn, iterable, max_pending):
+    """
+    executor.map と同様に順序どおり結果を返すが、未完了のタスク数を max_pending 以下に抑える。
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ワーカープロセスごとに1つだけ作る Unionization
+_worker_unionization = None
+
+
+def _init_worker(translator_backend, translator_options, tokenizer="mecab", translation_cache_path=None):
+    from tokenizer import create_tokenizer
+    from translation_cache import TranslationCache
+    from unionization_tmp import Unionization
+
+    global _worker_unionization
+    _worker_unionization = Unionization(
+        cache=TranslationCache(translation_cache_path),
+        backend=create_translator_backend(translator_backend, **translator_options),
+        tokenizer=create_tokenizer(tokenizer))
+
+
+def _process_chunk_in_worker(recipes):
+    _worker_unionization.failures = {}
+    return process_recipe_chunk(_worker_unionization, recipes)
+
 
 class CreateGraph:
-    BASE_PATH = "/home/group1/app/cash"  # 絶対パスの基準点
+    BASE_PATH = default_cache_root()  # 絶対パスの基準点（環境変数 RECIPE_CACHE_ROOT で変更できる）
+    PYVIS_MAX_EDGES = 5000  # これより多いエッジをpyvisで表示しようとすると警告する
     
-    def __init__(self):
-        # グラフの初期化
-        self.G = nx.Graph()
-        # 読み込んだレシピのリスト
+    def __init__(self, translator_backend="google", translator_options=None, workers=1, chunk_size=500,
+                 number_of_recipes=10000, streaming=False, incremental=False, cache_root=None,
+                 association_top_k=DEFAULT_TOP_K, tokenizer="mecab", recipe_loader=None, metrics=None):
+        if cache_root is not None:
+            self.BASE_PATH = cache_root
+        # 材料の正規化に使う翻訳バックエンド（"google", "google-batch", "dictionary"）
+        self.translator_backend = translator_backend
+        self.translator_options = translator_options or {}
+        # 材料名から名詞を取り出すトークナイザ（"mecab", "whitespace"）
+        self.tokenizer = tokenizer
+        # レシピの読み込み元（RecipeLoaderと同じく with 文と load_all_recipes() に対応するオブジェクト）。
+        # 指定がなければCookpadの RecipeLoader を使う
+        self.recipe_loader = recipe_loader
+        # 処理段階ごとの時間と件数（指定がなければプロセス共有の既定の Metrics）
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+        # グラフ構築に使うプロセス数（1なら逐次処理）と、1タスクあたりのレシピ数
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # 翻訳に失敗した材料と理由（グラフの頂点にはしない）
+        self.translation_failures = {}
+        # Trueの場合、レシピを保持せずに読み込みながらグラフを構築する
+        self.streaming = streaming
+        # Trueの場合、既存のグラフキャッシュに未処理のレシピだけを追加する
+        self.incremental = incremental
+        # 処理済みレシピのID -> 正規化済み材料名（incremental時のみ保持し、削除時の差し引きに使う）
+        self.recipe_index = {}
+        # remove_recipes で取り除いたレシピID（レシピのキャッシュと一緒に保存し、再構築でも読み飛ばす）
+        self.removed_recipe_ids = set()
+        # add_recipes で追加した、レシピのキャッシュにないレシピ（レシピID -> 材料リスト）。
+        # レシピのキャッシュと一緒に保存し、再構築でも処理する
+        self.added_recipes = {}
+        # 材料の語彙・出現レシピ数・共起回数を保持する主データ
+        self.store = CooccurrenceStore()
+        # NetworkXのグラフ（必要になったときに store から作る）
+        self._G = None
+        # 処理済みレシピIDのハッシュ（キャッシュの整合性確認に使う）
+        self.source_digest = 0
+        # 読み込んだグラフキャッシュのヘッダとノード統計量
+        self.cache_header = None
+        self.node_stats = None
+        # 関連度（PPMI・Jaccard・リフト）ごとの上位リスト。材料ごとに association_top_k 件まで保持する
+        self.association_top_k = association_top_k
+        self.associations = {}
+        # 読み込んだレシピの (レシピID, 材料リスト) のリスト
         self.loaded_recipes = []
-        # グラフのエッジの重みを保持する辞書
-        self.edge_weights = {}
-        # PyVisのネットワークの初期化
-        self.nt = Network(notebook=True)
+        # PyVisのネットワーク（可視化するときに作る）
+        self._nt = None
         # 読み込むレシピの数
-        self.number_of_recipes = 0
+        self.number_of_recipes = number_of_recipes
 
     def isRecipeCashAvailable(self, num):
         # 指定した数のレシピに関連するキャッシュファイルの存在を確認
-        file_path = os.path.join(self.BASE_PATH, "recipes", f"recipes.pickle_{num}")
+        file_path = os.path.join(self.BASE_PATH, "recipes", f"ingredients.pickle_{num}")
         return os.path.exists(file_path)
 
     def isGraphCashAvailable(self, num):
         # 指定した数のレシピに関連するグラフのキャッシュファイルの存在を確認
-        file_path = os.path.join(self.BASE_PATH, "graphs", f"graphs.pickle_{num}")
-        return os.path.exists(file_path)
+        return GraphCache(self.graph_cache_path(num)).exists() or os.path.exists(self.legacy_graph_cache_path(num))
 
     def ensure_directory_exists(self, dir_path):
         # 指定したディレクトリが存在しない場合、ディレクトリを作成
@@ -40,86 +154,460 @@ class CreateGraph:
     def load_recipes_from_cookpad(self):
         # コマンドラインから読み込むレシピの数を取得
         # self.number_of_recipes = self.get_integer_from_command_line()
-        self.number_of_recipes = 10000
 
+        # レシピ全体ではなく (レシピID, 材料リスト) だけを保持する
+        self.loaded_recipes = [item for chunk in self.iter_recipe_chunks() for item in chunk]
+
+    def iter_recipe_chunks(self):
+        """
+        (レシピID, 材料リスト) を chunk_size 件ずつ読み込んで返す。
+        キャッシュがない場合はRecipeLoaderから読み込みながらチャンク単位でキャッシュに追記するため、
+        メモリ使用量はレシピ数に比例しない。
+        """
         # レシピのキャッシュディレクトリのパスを作成し、存在しない場合はディレクトリを作成
         recipe_dir = os.path.join(self.BASE_PATH, "recipes")
         self.ensure_directory_exists(recipe_dir)
 
         # レシピのキャッシュファイルのパスを作成
-        recipe_file_path = os.path.join(recipe_dir, f"recipes.pickle_{self.number_of_recipes}")
+        recipe_file_path = os.path.join(recipe_dir, f"ingredients.pickle_{self.number_of_recipes}")
 
-        # キャッシュが存在しない場合、レシピを読み込みとキャッシュの保存を行う
-        if not self.isRecipeCashAvailable(self.number_of_recipes):
-            with RecipeLoader() as rl:
-                recipes_gen = rl.load_all_recipes()
-                self.loaded_recipes = [next(recipes_gen) for _ in range(self.number_of_recipes)]
-
-            with open(recipe_file_path, mode="wb") as f:
-                pickle.dump(self.loaded_recipes, f)
-        # キャッシュが存在する場合、キャッシュからレシピを読み込む
-        else:
+        # キャッシュが存在する場合、キャッシュからチャンクを順に読み込む
+        if self.isRecipeCashAvailable(self.number_of_recipes):
             with open(recipe_file_path, mode="rb") as f:
-                self.loaded_recipes = pickle.load(f)
+                while True:
+                    try:
+                        with self.metrics.stage("build.recipe_io"):
+                            chunk = pickle.load(f)
+                    except EOFError:
+                        return
+                    self.metrics.increment("recipes_loaded", len(chunk))
+                    yield chunk
+
+        # キャッシュが存在しない場合、レシピを読み込みながらキャッシュに追記する
+        tmp_file_path = recipe_file_path + ".tmp"
+        count = 0
+        digest = 0
+        loader = self.recipe_loader
+        if loader is None:
+            # RecipeLoaderはキャッシュがない場合だけ読み込む
+            from cookpad.recipe_loader import RecipeLoader
+            loader = RecipeLoader()
+
+        with loader as rl, open(tmp_file_path, mode="wb") as f:
+            # レシピが number_of_recipes より少なくても止まるように islice で読み込む
+            recipes = itertools.islice(rl.load_all_recipes(), self.number_of_recipes)
+            while True:
+                with self.metrics.stage("build.recipe_io"):
+                    chunk = [(get_recipe_id(recipe, count + i), recipe.get_ingredients())
+                             for i, recipe in enumerate(itertools.islice(recipes, self.chunk_size))]
+                    if chunk:
+                        pickle.dump(chunk, f)
+                if not chunk:
+                    break
+                self.metrics.increment("recipes_loaded", len(chunk))
+                count += len(chunk)
+                digest = combine_digests(digest, recipe_digest(recipe_id for recipe_id, _ in chunk))
+                yield chunk
+
+        if count < self.number_of_recipes:
+            print(f"レシピが {self.number_of_recipes} 件に満たないため、{count} 件で打ち切りました。", file=sys.stderr)
+        os.replace(tmp_file_path, recipe_file_path)
+        # グラフキャッシュの整合性確認用に、レシピIDのハッシュを保存する
+        with open(self.recipe_hash_path(self.number_of_recipes), mode="w", encoding="utf-8") as f:
+            f.write(f"{digest:032x}")
+
+    def translation_cache_path(self):
+        # 翻訳キャッシュもグラフと同じキャッシュのルートに置く
+        return os.path.join(self.BASE_PATH, "translations", "translations.sqlite3")
+
+    def recipe_hash_path(self, num):
+        return os.path.join(self.BASE_PATH, "recipes", f"ingredients.hash_{num}")
+
+    def recipe_changes_path(self, num, kind):
+        # add_recipes / remove_recipes による変更（kind は "added" または "removed"）
+        return os.path.join(self.BASE_PATH, "recipes", f"ingredients.{kind}_{num}")
+
+    def load_recipe_changes(self, num, kind, default):
+        changes_path = self.recipe_changes_path(num, kind)
+        if not os.path.exists(changes_path):
+            return default
+        with open(changes_path, mode="rb") as f:
+            return pickle.load(f)
+
+    def save_recipe_changes(self, num, kind, changes):
+        changes_path = self.recipe_changes_path(num, kind)
+        if not changes and not os.path.exists(changes_path):
+            return
+        self.ensure_directory_exists("recipes")
+        tmp_path = f"{changes_path}.tmp-{os.getpid()}"
+        with open(tmp_path, mode="wb") as f:
+            pickle.dump(changes, f)
+        os.replace(tmp_path, changes_path)
+
+    def load_removed_recipes(self, num):
+        # 取り除いたレシピIDの集合（なければ空）
+        return self.load_recipe_changes(num, "removed", set())
+
+    def load_added_recipes(self, num):
+        # 追加したレシピID -> 材料リスト（なければ空）
+        return self.load_recipe_changes(num, "added", {})
+
+    def expected_source_hash(self, num):
+        """
+        レシピのキャッシュと一緒に保存したハッシュに、追加したレシピの分を足し、取り除いたレシピの分を
+        差し引いた値（なければ検証しない）。
+        """
+        hash_path = self.recipe_hash_path(num)
+        if not os.path.exists(hash_path):
+            return None
+        with open(hash_path, encoding="utf-8") as f:
+            digest = int(f.read().strip(), 16)
+        digest = combine_digests(digest, recipe_digest(self.load_added_recipes(num)))
+        return f"{combine_digests(digest, recipe_digest(self.load_removed_recipes(num)), sign=-1):032x}"
+
+    def translator_metadata(self):
+        # グラフの作成に使う正規化バックエンドの情報
+        metadata = create_translator_backend(self.translator_backend, **self.translator_options).metadata()
+        if self.tokenizer != "mecab":
+            # 既定のMeCab以外のトークナイザで作ったグラフは、既存のキャッシュと区別する
+            metadata["tokenizer"] = self.tokenizer
+        return metadata
 
     def build_graph(self):
+        """
+        キャッシュからグラフを読み込み、なければレシピから構築する。
+        構築した場合は、段階ごとの処理時間と件数を graphs/build_metrics_{レシピ数}.json に保存する。
+        """
+        processed_before = self.metrics.counters.get("recipes_processed", 0)
+        started = time.perf_counter()
+        with profiled("build_graph"), self.metrics.stage("build.total"):
+            built = self._build_graph()
+        if built:
+            elapsed = time.perf_counter() - started
+            processed = self.metrics.counters.get("recipes_processed", 0) - processed_before
+            metrics_file_path = os.path.join(self.BASE_PATH, "graphs", f"build_metrics_{self.number_of_recipes}.json")
+            self.metrics.write_json(metrics_file_path)
+            print(f"Build: {processed} recipes in {elapsed:.2f}s ({processed / elapsed:.0f} recipes/s), "
+                  f"metrics: {metrics_file_path}", file=sys.stderr)
+
+    def _build_graph(self):
         # グラフのキャッシュディレクトリのパスを作成し、存在しない場合はディレクトリを作成
         graph_dir = os.path.join(self.BASE_PATH, "graphs")
         self.ensure_directory_exists(graph_dir)
+        self.removed_recipe_ids = self.load_removed_recipes(self.number_of_recipes)
+        self.added_recipes = self.load_added_recipes(self.number_of_recipes)
 
-        # グラフのキャッシュファイルのパスを作成
-        graph_file_path = os.path.join(graph_dir, f"graphs.pickle_{self.number_of_recipes}")
+        # キャッシュが存在する場合、キャッシュからグラフを読み込む
+        if self.isGraphCashAvailable(self.number_of_recipes):
+            try:
+                self.load_graph_cache(self.number_of_recipes)
+                return False
+            except StaleCacheError as e:
+                # 古いキャッシュは黙って使わず、作り直す
+                print(f"グラフのキャッシュが古いため再構築します: {e}", file=sys.stderr)
+                self.reset_graph()
 
         # キャッシュが存在しない場合、レシピからグラフを構築し、キャッシュとして保存
-        if not self.isGraphCashAvailable(self.number_of_recipes):
-            if not self.loaded_recipes:
-                self.load_recipes_from_cookpad()
-
-            for recipe in tqdm(self.loaded_recipes, desc="Processing recipes"):
-                ingredients = recipe.get_ingredients()
-                
-                # Unionization インスタンスの作成
-                unionization = Unionization()
-                
-                # 材料を英語に翻訳した上で統一化
-                ingredients = unionization.translate_given_ingredients(ingredients)
-                
-                # print(ingredients)
-                
-                for ingredient, _ in ingredients:
-                    self.G.add_node(ingredient)
-
-                for i in range(len(ingredients) - 1):
-                    for j in range(i + 1, len(ingredients)):
-                        edge_key = tuple(sorted([ingredients[i][0], ingredients[j][0]]))
-                        self.edge_weights[edge_key] = self.edge_weights.get(edge_key, 0) + 1
-
-            for (src, dst), weight in self.edge_weights.items():
-                self.G.add_edge(src, dst, weight=weight)
-
-            with open(graph_file_path, mode="wb") as f:
-                pickle.dump((self.G, self.edge_weights), f)
-        # キャッシュが存在する場合、キャッシュからグラフを読み込む
+        if self.incremental:
+            # より少ないレシピ数で作った最新のキャッシュがあれば、そこから差分だけを処理する
+            latest = self.find_latest_graph_cache(self.number_of_recipes)
+            if latest is not None:
+                self.load_graph_cache(latest, verify_source=False)
+                # 元のキャッシュで取り除いた・追加したレシピも引き継ぐ
+                self.removed_recipe_ids |= self.load_removed_recipes(self.number_of_recipes)
+                self.added_recipes.update(self.load_added_recipes(self.number_of_recipes))
+                print(f"graph_{latest} から差分を構築します（処理済み {len(self.recipe_index)} 件）", file=sys.stderr)
+
+        if not self.loaded_recipes and not self.streaming:
+            self.load_recipes_from_cookpad()
+
+        self.apply_chunks(self.process_chunks(self.iter_ingredient_chunks()))
+
+        if self.translation_failures:
+            # 失敗した材料は別ファイルに記録する
+            failures_file_path = os.path.join(graph_dir, f"translation_failures_{self.number_of_recipes}.json")
+            with open(failures_file_path, mode="w", encoding="utf-8") as f:
+                json.dump(self.translation_failures, f, ensure_ascii=False, indent=2)
+            print(f"Translation failures: {len(self.translation_failures)} ({failures_file_path})", file=sys.stderr)
+
+        self.save_graph_cache(self.number_of_recipes)
+        return True
+
+    def graph_cache_path(self, num):
+        return os.path.join(self.BASE_PATH, "graphs", f"graph_{num}")
+
+    def legacy_graph_cache_path(self, num):
+        # 以前のpickle形式のキャッシュ
+        return os.path.join(self.BASE_PATH, "graphs", f"graphs.pickle_{num}")
+
+    def reset_graph(self):
+        self.store = CooccurrenceStore()
+        self.recipe_index = {}
+        self.source_digest = 0
+        self.cache_header = None
+        self.node_stats = None
+        self.associations = {}
+        self._G = None
+
+    def find_latest_graph_cache(self, num):
+        """
+        num より少ないレシピ数で作られたグラフキャッシュのうち、差分構築に使える最もレシピ数が多いものを返す。
+        """
+        graph_dir = os.path.join(self.BASE_PATH, "graphs")
+        candidates = []
+        for file_name in os.listdir(graph_dir):
+            prefix, _, suffix = file_name.partition("graph_")
+            if not prefix and suffix.isdigit() and int(suffix) < num:
+                candidates.append(int(suffix))
+        translator = self.translator_metadata()
+        for candidate in sorted(candidates, reverse=True):
+            cache = GraphCache(self.graph_cache_path(candidate))
+            # レシピの索引を持たないキャッシュや、正規化バックエンドが異なるキャッシュからは差分構築できない
+            if not cache.exists() or not os.path.exists(cache.extra_path("recipe_index.pickle")):
+                continue
+            try:
+                cache.validate(cache.read_header(), translator=translator)
+            except StaleCacheError:
+                continue
+            return candidate
+        return None
+
+    def load_graph_cache(self, num, verify_source=True):
+        with self.metrics.stage("build.cache_load"):
+            self._load_graph_cache(num, verify_source)
+
+    def _load_graph_cache(self, num, verify_source):
+        cache = GraphCache(self.graph_cache_path(num))
+        if not cache.exists():
+            self.load_legacy_graph_cache(num)
+            return
+
+        source_hash = self.expected_source_hash(num) if verify_source else None
+        self.store, self.cache_header, self.node_stats = cache.load(
+            source_hash=source_hash, translator=self.translator_metadata())
+        self.associations = cache.load_associations(self.cache_header)
+        self.source_digest = int(self.cache_header.get("source_hash") or "0", 16)
+        self.removed_recipe_ids = self.load_removed_recipes(num)
+        self.added_recipes = self.load_added_recipes(num)
+        self.recipe_index = {}
+        # レシピの索引は差分構築のときだけ読み込む
+        recipe_index_path = cache.extra_path("recipe_index.pickle")
+        if self.incremental and os.path.exists(recipe_index_path):
+            with open(recipe_index_path, mode="rb") as f:
+                self.recipe_index = pickle.load(f)
+        self._G = None
+
+    def load_legacy_graph_cache(self, num):
+        with open(self.legacy_graph_cache_path(num), mode="rb") as f:
+            loaded_data = pickle.load(f)
+
+        if isinstance(loaded_data, dict) and isinstance(loaded_data.get("store"), CooccurrenceStore):
+            self.store = loaded_data["store"]
+            self.recipe_index = loaded_data.get("recipe_index", {})
+        # 旧形式 (G, edge_weights[, state]) のキャッシュ
+        elif isinstance(loaded_data, tuple) and len(loaded_data) in (2, 3):
+            G, edge_weights = loaded_data[:2]
+            self.store = CooccurrenceStore.from_edge_weights(G.nodes, edge_weights)
+            self.recipe_index = {}
+        else:
+            raise ValueError("キャッシュファイルのフォーマットが不正です。")
+        self.associations = {}
+        self._G = None
+
+    def save_graph_cache(self, num):
+        cache = GraphCache(self.graph_cache_path(num))
+        associations = self.association_indexes()
+        with self.metrics.stage("build.write_cache"):
+            self.cache_header = cache.write(
+                self.store,
+                associations=associations,
+                source_hash=f"{self.source_digest:032x}",
+                translator=self.translator_metadata(),
+                number_of_recipes=num,
+                # レシピの索引は差分構築のときだけ、グラフと同じバージョンに保存する
+                extras={"recipe_index.pickle": self.recipe_index} if self.incremental else None,
+            )
+            # 追加・削除したレシピを記録しておき、次回の読み込みでハッシュの検証と再構築に使う
+            self.save_recipe_changes(num, "added", self.added_recipes)
+            self.save_recipe_changes(num, "removed", self.removed_recipe_ids)
+        self.metrics.increment("cache_bytes_written", sum(
+            os.path.getsize(os.path.join(cache.directory, name)) for name in os.listdir(cache.directory)))
+
+    def association_indexes(self):
+        """
+        関連度ごとの上位リストを返す。グラフが変更された後や、キャッシュに含まれていない場合は作り直す。
+        """
+        if (set(self.associations) != set(ASSOCIATION_MEASURES)
+                or any(index.top_k != self.association_top_k for index in self.associations.values())):
+            with self.metrics.stage("build.associations"):
+                self.associations = build_association_indexes(self.store, top_k=self.association_top_k)
+        return self.associations
+
+    @property
+    def G(self):
+        # NetworkXのグラフは可視化や分析で必要になったときに作る
+        if self._G is None:
+            self._G = self.store.to_networkx()
+        return self._G
+
+    @property
+    def edge_weights(self):
+        # {(材料名, 材料名): 共起回数} の辞書（従来の形式）
+        return self.store.edge_weights()
+
+    def apply_chunks(self, results):
+        """
+        チャンクごとの部分結果を統合する。
+        """
+        from tqdm import tqdm
+
+        cache_stats = Counter()
+        for recipe_names, chunk_store, chunk_failures, chunk_metrics in tqdm(
+                results, desc="Processing recipe chunks"):
+            # ワーカーごとの部分的な共起カウントを統合
+            with self.metrics.stage("build.merge"):
+                self.store.merge(chunk_store)
+            self.translation_failures.update(chunk_failures)
+            self.metrics.merge(chunk_metrics)
+            cache_stats.update({name[len("translation_cache_"):]: value
+                                for name, value in chunk_metrics["counters"].items()
+                                if name.startswith("translation_cache_")})
+            self.source_digest = combine_digests(
+                self.source_digest, recipe_digest(recipe_id for recipe_id, _ in recipe_names))
+            if self.incremental:
+                self.recipe_index.update(recipe_names)
+        with self.metrics.stage("build.merge"):
+            self.store.compact()
+        self.invalidate_derived()
+
+        # 翻訳キャッシュの効果を確認できるようにヒット数を出力
+        print(f"Translation cache: {dict(cache_stats)}", file=sys.stderr)
+
+    def invalidate_derived(self):
+        # ストアが変わったので、キャッシュのヘッダー（graph_version）・統計・関連度は使えない
+        self.cache_header = None
+        self.node_stats = None
+        self.associations = {}
+        self._G = None
+
+    def require_recipe_index(self, method):
+        # recipe_index は incremental=True のときだけ保持するため、それ以外では重複や削除を判定できない
+        if not self.incremental:
+            raise ValueError(f"{method} を使うには CreateGraph(incremental=True) でグラフを作成してください。")
+
+    def add_recipes(self, recipes):
+        """
+        (レシピID, 材料リスト) を未処理のものだけグラフに追加する。
+        処理済みのレシピは recipe_index で判定するため、incremental=True で作ったときだけ使える。
+        """
+        self.require_recipe_index("add_recipes")
+        pending = [(recipe_id, ingredients) for recipe_id, ingredients in recipes
+                   if recipe_id not in self.recipe_index]
+        for recipe_id, ingredients in pending:
+            if recipe_id in self.removed_recipe_ids:
+                # 取り除いた後に追加し直したレシピは、レシピのキャッシュにある
+                self.removed_recipe_ids.discard(recipe_id)
+            else:
+                self.added_recipes[recipe_id] = ingredients
+        chunks = (pending[start:start + self.chunk_size] for start in range(0, len(pending), self.chunk_size))
+        self.apply_chunks(self.process_chunks(chunks))
+
+    def remove_recipes(self, recipe_ids):
+        """
+        処理済みのレシピをグラフから取り除き、その寄与を共起回数から差し引く。
+        取り除く材料は recipe_index から引くため、incremental=True で作ったときだけ使える。
+        """
+        self.require_recipe_index("remove_recipes")
+        removed_ids = [recipe_id for recipe_id in recipe_ids if recipe_id in self.recipe_index]
+        removed = [self.recipe_index.pop(recipe_id) for recipe_id in removed_ids]
+        self.source_digest = combine_digests(self.source_digest, recipe_digest(removed_ids), sign=-1)
+        for recipe_id in removed_ids:
+            # 追加したレシピを取り除いた場合は、追加の記録を消すだけでよい
+            if self.added_recipes.pop(recipe_id, None) is None:
+                self.removed_recipe_ids.add(recipe_id)
+        for names in removed:
+            self.store.add_recipe(names, sign=-1)
+        self.store.compact()
+        self.invalidate_derived()
+        return len(removed)
+
+    def iter_ingredient_chunks(self):
+        # (レシピID, 材料リスト) を chunk_size 件ずつ返す（ストリーミング時はRecipeLoaderから直接読み込む）
+        if self.loaded_recipes:
+            chunks = (self.loaded_recipes[start:start + self.chunk_size]
+                      for start in range(0, len(self.loaded_recipes), self.chunk_size))
         else:
-            with open(graph_file_path, mode="rb") as f:
-                loaded_data = pickle.load(f)
+            chunks = self.iter_recipe_chunks()
+
+        for chunk in chunks:
+            # 追加したレシピがレシピのキャッシュに含まれるようになった場合は、キャッシュの方を使う
+            if self.added_recipes:
+                for recipe_id, _ in chunk:
+                    self.added_recipes.pop(recipe_id, None)
+            # 差分構築では処理済みのレシピを、どちらの場合も取り除いたレシピを読み飛ばす
+            if self.recipe_index or self.removed_recipe_ids:
+                chunk = [recipe for recipe in chunk
+                         if recipe[0] not in self.recipe_index and recipe[0] not in self.removed_recipe_ids]
+            if chunk:
+                yield chunk
+
+        # add_recipes で追加したレシピは、レシピのキャッシュの後に処理する
+        added = [recipe for recipe in self.added_recipes.items() if recipe[0] not in self.recipe_index]
+        for start in range(0, len(added), self.chunk_size):
+            yield added[start:start + self.chunk_size]
+
+    def process_chunks(self, chunks):
+        """
+        レシピのチャンクを正規化・カウントし、部分結果を順に返す。
+        workers が2以上の場合はプロセスプールで並列に処理する。
+        並行に翻訳するバックエンドの rate はワーカーで等分する（合計が指定した上限になる）。
+        """
+        # 正規化（翻訳・形態素解析）のモジュールは、レシピを処理するときだけ読み込む
+        from tokenizer import create_tokenizer
+        from translation_cache import TranslationCache
+        from unionization_tmp import Unionization
 
-                if not isinstance(loaded_data, tuple) or len(loaded_data) != 2:
-                    raise ValueError("キャッシュファイルのフォーマットが不正です。")
+        if self.workers <= 1:
+            cache = TranslationCache(self.translation_cache_path())
+            unionization = Unionization(
+                cache=cache,
+                backend=create_translator_backend(self.translator_backend, **self.translator_options),
+                tokenizer=create_tokenizer(self.tokenizer))
+            try:
+                for recipes in chunks:
+                    unionization.failures = {}
+                    yield process_recipe_chunk(unionization, recipes)
+            finally:
+                cache.close()
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
 
-                self.G, self.edge_weights = loaded_data
+        worker_options = per_process_options(self.translator_backend, self.translator_options, self.workers)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.translator_backend, worker_options,
+                                           self.tokenizer, self.translation_cache_path())) as executor:
+            # 読み込み済みのチャンクが溜まりすぎないよう、投入するタスク数を制限する
+            yield from bounded_map(executor, _process_chunk_in_worker, chunks, max_pending=self.workers * 2)
+
+    @property
+    def nt(self):
+        # pyvisは可視化するときだけ読み込む
+        if self._nt is None:
+            from pyvis.network import Network
+            self._nt = Network(notebook=True)
+        return self._nt
 
     def convert_to_pyvis(self):
         # NetworkXのグラフをPyVisのネットワークに変換
-        self.nt.from_nx(self.G)
+        # edge_scaling=True でエッジの weight（共起回数）がそのまま value になるため、エッジごとに重みを引き直さない
+        # 大きなグラフは物理シミュレーションが重くなるので、GraphAnalyzer.export_view で絞り込んだ表示を使う
+        if self.store.number_of_edges() > self.PYVIS_MAX_EDGES:
+            print(f"{self.store.number_of_edges()} edges may be too many to display; "
+                  f"consider GraphAnalyzer.export_view for an ego/backbone/community view.", file=sys.stderr)
+        self.nt.from_nx(self.G, edge_scaling=True)
         self.nt.show_buttons(True)
 
-        for edge in self.nt.edges:
-            src, dst = edge["from"], edge["to"]
-            edge_key = tuple(sorted([src, dst]))
-            weight = self.edge_weights.get(edge_key, 0)
-            edge["value"] = weight
-
     def show_graph(self):
         # PyVisのネットワークをHTMLファイルとして表示
         self.nt.show(f"graph_{self.number_of_recipes}.html")
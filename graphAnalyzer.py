@@ -1,18 +1,218 @@
-import networkx as nx
-from collections import Counter, defaultdict
-from networkx.algorithms import community
-import community as louvain_community  # Louvain method のインポート
-import networkx.algorithms.community
-from tqdm import tqdm
-import community as community_louvain
-import itertools
+import os
+import pickle
+import numpy as np
+from cooccurrence import CooccurrenceStore
+from scoring import ScoringEngine
+from community_detection import CommunityResult, detect_communities
+from graph_cache import node_stats
+from association import ASSOCIATION_MEASURES, DEFAULT_TOP_K, AssociationIndex
+from metrics import get_default_metrics, profiled
+
+
+# バッチ推薦のワーカープロセスで使うスコア計算エンジン
+_worker_engine = None
+
+
+def _init_batch_worker(engine):
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _recommend_batch_in_worker(args):
+    id_lists, k, mode = args
+    return _worker_engine.recommend_batch(id_lists, k, mode)
 
 
 class GraphAnalyzer:
-    def __init__(self, graph):
-        self.G = graph
-        
-        
+    # Louvain法の乱数シード（同じグラフなら毎回同じコミュニティになるように固定）
+    LOUVAIN_SEED = 42
+
+    def __init__(self, graph=None, cache_dir=None, graph_version=None, seed=LOUVAIN_SEED, store=None,
+                 community_algorithm="louvain", associations=None, association_top_k=DEFAULT_TOP_K,
+                 metrics=None):
+        self.seed = seed
+        # 分析・推薦の処理時間と件数（指定がなければプロセス共有の既定の Metrics）
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+        # コミュニティ検出のアルゴリズム（"louvain", "leiden", "label_propagation"）
+        self.community_algorithm = community_algorithm
+        # 関連度の上位リストを新しく作るときの件数
+        self.association_top_k = association_top_k
+        # コミュニティと中心性を保存するディレクトリ（グラフキャッシュと同じ場所）
+        self.cache_dir = cache_dir
+        self.set_graph(graph, graph_version, store, associations)
+
+    @classmethod
+    def from_graph_builder(cls, graph_builder, **kwargs):
+        """
+        CreateGraph で構築・読み込みしたグラフから作る。分析結果はグラフキャッシュの隣に保存される。
+        """
+        header = graph_builder.cache_header or {}
+        return cls(cache_dir=graph_builder.graph_cache_path(graph_builder.number_of_recipes),
+                   graph_version=header.get("graph_version"), store=graph_builder.store,
+                   associations=graph_builder.association_indexes(), **kwargs)
+
+    def set_graph(self, graph=None, graph_version=None, store=None, associations=None):
+        """
+        分析対象のグラフ（NetworkXのグラフまたは CooccurrenceStore）を差し替え、
+        グラフに依存する計算結果を破棄する。associations にはグラフキャッシュの関連度の上位リストを渡せる。
+        """
+        if graph is None and store is None:
+            raise ValueError("graph または store を指定してください。")
+        self._G = graph
+        self._store = store
+        self.graph_version = graph_version
+        self._community_result = None
+        self._centralities = None
+        self._community_map = None
+        self._centrality = None
+        self._engine = None
+        self._associations = dict(associations or {})
+
+    @property
+    def G(self):
+        # NetworkXのグラフは、Louvain法や経路探索などで必要になったときに作る
+        if self._G is None:
+            self._G = self._store.to_networkx()
+        return self._G
+
+    @property
+    def store(self):
+        # 隣接行列によるスコア計算に使うストア
+        if self._store is None:
+            self._store = CooccurrenceStore.from_edge_weights(
+                self._G.nodes, {(u, v): data.get('weight', 1) for u, v, data in self._G.edges(data=True)})
+        return self._store
+
+    @property
+    def engine(self):
+        """
+        CSRの隣接行列・コミュニティ・中心性を配列にまとめたスコア計算エンジン。
+        """
+        if self._engine is None:
+            self.ensure_analysis()
+            with self.metrics.stage("query.build_engine"):
+                self._engine = ScoringEngine(self.store.csr(), self._community_result.labels, self._centralities)
+        return self._engine
+
+    def association_index(self, measure="ppmi"):
+        """
+        関連度（"ppmi", "jaccard", "lift"）ごとの上位リスト。グラフキャッシュになければここで作る。
+        """
+        if measure not in ASSOCIATION_MEASURES:
+            raise ValueError(f"未知の関連度です: {measure} (選択肢: {', '.join(ASSOCIATION_MEASURES)})")
+        if measure not in self._associations:
+            with self.metrics.stage("query.build_associations"):
+                self._associations[measure] = AssociationIndex.build(self.store, measure, self.association_top_k)
+        return self._associations[measure]
+
+    def lookup_ingredients(self, ingredients):
+        # グラフに存在する材料のIDのリスト（重複はそのまま残す）
+        ids = self.store.vocabulary.ids
+        active = self.store.node_counts
+        return [ids[ingredient] for ingredient in ingredients
+                if ingredient in ids and active[ids[ingredient]] > 0]
+
+    @property
+    def analysis_cache_path(self):
+        if self.cache_dir is None or self.graph_version is None:
+            return None
+        return os.path.join(self.cache_dir, "analysis.pickle")
+
+    def load_analysis(self):
+        # 同じグラフのバージョン・シード・アルゴリズムで計算した結果があれば読み込む
+        path = self.analysis_cache_path
+        if path is None or not os.path.exists(path):
+            return False
+        with open(path, mode="rb") as f:
+            analysis = pickle.load(f)
+        if (analysis.get("graph_version") != self.graph_version or analysis.get("seed") != self.seed
+                or analysis.get("algorithm") != self.community_algorithm or "labels" not in analysis):
+            return False
+        # 語彙の数が違う結果は別のグラフのもの（配列の添字がずれる）
+        if len(analysis["labels"]) != len(self.store.vocabulary):
+            return False
+        self._community_result = CommunityResult(analysis["labels"], analysis["algorithm"], analysis["seed"],
+                                                 analysis["modularity"], analysis["elapsed"])
+        self._centralities = analysis["centralities"]
+        return True
+
+    def save_analysis(self):
+        path = self.analysis_cache_path
+        if path is None or not os.path.isdir(self.cache_dir):
+            return
+        result = self._community_result
+        analysis = {
+            "graph_version": self.graph_version,
+            "seed": self.seed,
+            "algorithm": result.algorithm,
+            "labels": result.labels,
+            "modularity": result.modularity,
+            "elapsed": result.elapsed,
+            "centralities": self._centralities,
+        }
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, mode="wb") as f:
+            pickle.dump(analysis, f)
+        os.replace(tmp_path, path)
+
+    def compute_centralities(self):
+        """
+        ノードIDごとの次数中心性（networkx.degree_centrality と同じく次数 / (ノード数 - 1)）。
+        """
+        store = self.store
+        active = store.active_nodes()
+        centralities = np.zeros(len(store.vocabulary), dtype=np.float64)
+        if len(active) > 1:
+            degree = node_stats(store.csr())["degree"]
+            centralities[active] = degree[active] / (len(active) - 1)
+        elif len(active) == 1:
+            centralities[active] = 1.0
+        return centralities
+
+    def ensure_analysis(self):
+        """
+        コミュニティと中心性をグラフのバージョンごとに1度だけ計算する。
+        推薦・コミュニティの一覧など、すべてのメソッドがこの結果を共有する。
+        """
+        if self._community_result is not None:
+            return
+        with self.metrics.stage("analysis.load"):
+            loaded = self.load_analysis()
+        if loaded:
+            return
+        with profiled("analysis"):
+            with self.metrics.stage(f"analysis.{self.community_algorithm}"):
+                self._community_result = detect_communities(self.store.csr(), self.store.active_nodes(),
+                                                            self.community_algorithm, self.seed)
+            with self.metrics.stage("analysis.centrality"):
+                self._centralities = self.compute_centralities()
+        self.save_analysis()
+
+    @property
+    def community_result(self):
+        # コミュニティ検出の結果（ラベル・モジュラリティ・計算時間）
+        self.ensure_analysis()
+        return self._community_result
+
+    @property
+    def community_map(self):
+        # ノード -> コミュニティID
+        if self._community_map is None:
+            labels = self.community_result.labels
+            names = self.store.vocabulary.names
+            self._community_map = {names[index]: int(labels[index]) for index in self.store.active_nodes().tolist()}
+        return self._community_map
+
+    @property
+    def centrality(self):
+        # ノード -> 次数中心性
+        if self._centrality is None:
+            self.ensure_analysis()
+            names = self.store.vocabulary.names
+            self._centrality = {names[index]: float(self._centralities[index])
+                                for index in self.store.active_nodes().tolist()}
+        return self._centrality
+
     def find_common_neighbors(self, ingredient1, ingredient2):
         # Check if both ingredients are in the graph
         if ingredient1 not in self.G or ingredient2 not in self.G:
@@ -39,6 +239,8 @@ class GraphAnalyzer:
             print(f"{ingredient1} または {ingredient2} はグラフに存在しません。")
             return
 
+        import networkx as nx
+
         try:
             path = nx.shortest_path(
                 self.G, source=ingredient1, target=ingredient2)
@@ -51,6 +253,8 @@ class GraphAnalyzer:
         """
         グラフ内のクラスタ（連結成分）を返す。
         """
+        import networkx as nx
+
         return [list(cluster) for cluster in nx.connected_components(self.G)]
 
     def analyze_clusters(self):
@@ -91,58 +295,53 @@ class GraphAnalyzer:
         return subgraph
 
     def recommend_ingredients(self, ingredients, num_recommendations):
-        # 各食材の隣接ノードと、それらとのエッジの重さを取得
-        adjacent_nodes_weights = {}
-
-        # コミュニティの検出（和風、洋風などでカテゴライズ）
-        community_map = louvain_community.best_partition(
-            self.G)  # コミュニティIDに基づいてノードをマッピング
-
-        # 与えられた食材が所属するコミュニティを特定
-        ingredient_communities = {ingredient: community_map[ingredient]
-                                  for ingredient in ingredients if ingredient in community_map}
-        target_communities = set(ingredient_communities.values())
-
-        for ingredient in ingredients:
-            if ingredient in self.G:
-                for neighbor in self.G.neighbors(ingredient):
-                    # ここでコミュニティの情報を利用して推薦をフィルタリング
-                    if neighbor in community_map and community_map[neighbor] not in target_communities:
-                        continue  # この隣接ノードはターゲットのコミュニティに属していないのでスキップ
-
-                    weight = self.G[ingredient][neighbor].get(
-                        'weight', 1)  # 重さが設定されていないエッジは重さを1とする
-                    if neighbor in adjacent_nodes_weights:
-                        adjacent_nodes_weights[neighbor] += weight
-                    else:
-                        adjacent_nodes_weights[neighbor] = weight
-
-        # 入力された食材を除外
-        for ingredient in ingredients:
-            if ingredient in adjacent_nodes_weights:
-                del adjacent_nodes_weights[ingredient]
-
-        # グラフの中心性を取得（より一般的な食材が候補に上がるように補正）
-        centrality = nx.degree_centrality(self.G)
-        for node, weight in adjacent_nodes_weights.items():
-            # 中心性の値で重さを補正する
-            adjusted_weight = weight * centrality.get(node, 1)
-            adjacent_nodes_weights[node] = adjusted_weight
-
-        # 最も関連の深い食材を返す（エッジの重さの合計に基づいて）
-        recommended = sorted(adjacent_nodes_weights.items(),
-                             key=lambda x: x[1], reverse=True)
-        return [item[0] for item in recommended[:num_recommendations]]
+        """
+        与えられた食材の隣接ノードを、エッジの重さの合計に中心性を掛けたスコアで推薦する。
+        与えられた食材と同じコミュニティ（和風、洋風など）に属する食材だけを候補にする。
+        """
+        query_ids = self.lookup_ingredients(ingredients)
+        engine = self.engine
+        with profiled("recommend"), self.metrics.stage("query.recommend"):
+            recommended, _ = engine.recommend(query_ids, num_recommendations)
+        self.metrics.increment("queries")
+        names = self.store.vocabulary.names
+        return [names[index] for index in recommended.tolist()]
+
+    def export_view(self, mode="backbone", ingredients=None, output_dir=".", name=None, max_nodes=150,
+                    max_edges=2000, recommendations=10):
+        """
+        グラフ全体ではなく、ブラウザで扱える大きさに絞った部分グラフをHTMLとJSONに書き出し、両方のパスを返す。
+        mode は "ego"（ingredients の周辺と推薦結果）、"backbone"（重みの大きいエッジ）、
+        "communities"（コミュニティ単位に集約）のいずれか。
+        """
+        import graph_export
+
+        labels = self.community_result.labels
+        strength = np.asarray(self.store.csr().sum(axis=1)).ravel()
+        with self.metrics.stage(f"export.{mode}"):
+            if mode == "ego":
+                query_ids = self.lookup_ingredients(ingredients or [])
+                if not query_ids:
+                    raise ValueError("ego ビューにはグラフに含まれる材料を1つ以上指定してください。")
+                recommended = self.recommend_ingredients(ingredients, recommendations) if recommendations else []
+                view = graph_export.ego_view(self.store, query_ids, labels, strength,
+                                             self.lookup_ingredients(recommended), max_nodes, max_edges)
+            elif mode == "backbone":
+                view = graph_export.backbone_view(self.store, labels, strength, max_edges)
+            elif mode == "communities":
+                view = graph_export.community_view(self.store, labels, strength, max_edges)
+            else:
+                raise ValueError(f"未知の表示モードです: {mode}（{', '.join(graph_export.VIEW_MODES)} のいずれか）")
+            return graph_export.write_view(view, output_dir, name)
 
     def detect_communities(self):
         """
         グラフ内のコミュニティを検出し、ノードのリストとして返します。
+        推薦と同じキャッシュ済みの分割を使い、大きいコミュニティから順に番号を付けます。
         """
-        # Louvain法を用いたコミュニティ検出
-        communities_generator = community.greedy_modularity_communities(self.G)
-
-        # 各コミュニティを番号付きで返す
-        return {idx: list(community) for idx, community in enumerate(communities_generator)}
+        names = self.store.vocabulary.names
+        return {idx: [names[index] for index in group.tolist()]
+                for idx, group in enumerate(self.community_result.groups())}
 
 
     def print_communities_and_top_ingredients(self, top_n=5):
@@ -151,6 +350,9 @@ class GraphAnalyzer:
         """
         # コミュニティの検出
         communities = self.detect_communities()
+        result = self.community_result
+        print(f"Algorithm: {result.algorithm}, Modularity: {result.modularity:.4f}, "
+              f"Communities: {len(communities)}, Time: {result.elapsed:.2f}s")
 
         # コミュニティとそのトップ食材の出力
         for idx, community in communities.items():
@@ -166,48 +368,74 @@ class GraphAnalyzer:
             
 
     def recommend_cooccurring_ingredients(self, ingredients, num_recommendations):
+        """
+        与えられた食材のペアに共通する隣接ノードを優先して推薦する。
+        共通の隣接ノードがない場合は recommend_ingredients と同じ基準で評価する。
+        """
         # 入力のバリデーション
         if not isinstance(ingredients, list) or not ingredients:
             raise ValueError("食材は非空のリストでなければなりません。")
 
-        # 食材間の共通の隣接ノードと重みを格納する辞書
-        adjacent_nodes_weights = defaultdict(int)
-        common_neighbors_found = False
-
-        # コミュニティマップと中心性を計算
-        community_map = community_louvain.best_partition(self.G)
-        centrality = nx.degree_centrality(self.G)
-
-        # 与えられた食材のコミュニティを特定
-        ingredient_communities = {ingredient: community_map[ingredient]
-                                for ingredient in ingredients if ingredient in community_map}
-        target_communities = set(ingredient_communities.values())
-
-        # 食材リストのすべての組み合わせを繰り返す
-        for pair in itertools.combinations(ingredients, 2):
-            common_neighbors = set(self.G.neighbors(pair[0])).intersection(set(self.G.neighbors(pair[1])))
-            if common_neighbors:
-                common_neighbors_found = True
-                for neighbor in common_neighbors:
-                    if community_map[neighbor] in target_communities:
-                        weight = self.G[pair[0]][neighbor].get('weight', 1) + self.G[pair[1]][neighbor].get('weight', 1)
-                        adjusted_weight = weight * centrality[neighbor]
-                        adjacent_nodes_weights[neighbor] += adjusted_weight
-
-        # 共通の隣接ノードが見つからない場合は中心性とコミュニティのみで評価
-        if not common_neighbors_found:
-            for ingredient in ingredients:
-                for neighbor in self.G.neighbors(ingredient):
-                    if neighbor in ingredients or community_map[neighbor] not in target_communities:
-                        continue
-                    weight = self.G[ingredient][neighbor].get('weight', 1)
-                    adjusted_weight = weight * centrality[neighbor]
-                    adjacent_nodes_weights[neighbor] += adjusted_weight
-
-        # 推薦から入力された食材を除外
-        for ingredient in ingredients:
-            adjacent_nodes_weights.pop(ingredient, None)
+        query_ids = self.lookup_ingredients(ingredients)
+        engine = self.engine
+        with profiled("recommend_cooccurring"), self.metrics.stage("query.recommend_cooccurring"):
+            recommended, _ = engine.recommend_cooccurring(query_ids, num_recommendations)
+        self.metrics.increment("queries")
+        names = self.store.vocabulary.names
+        return [names[index] for index in recommended.tolist()]
 
-        # エッジの重さの合計に基づいて関連の深い食材をソート
-        recommended = sorted(adjacent_nodes_weights.items(), key=lambda x: x[1], reverse=True)
-        return [item[0] for item in recommended[:num_recommendations]]
+    def recommend_associated_ingredients(self, ingredients, num_recommendations, measure="ppmi"):
+        """
+        与えられた食材との関連度（PPMI・Jaccard・リフト）の合計が大きい食材を推薦する。
+        共起回数と違って、どのレシピにも出てくる調味料ばかりが上位になることはない。
+        材料ごとに保存済みの上位リストを合わせるだけなので、隣接ノードの多い材料でも一定の時間で答えられる。
+        """
+        query_ids = self.lookup_ingredients(ingredients)
+        association = self.association_index(measure)
+        with profiled(f"recommend_{measure}"), self.metrics.stage(f"query.recommend_{measure}"):
+            recommended, _ = association.recommend(query_ids, num_recommendations)
+        self.metrics.increment("queries")
+        names = self.store.vocabulary.names
+        return [names[index] for index in recommended.tolist()]
+
+    def recommend_ingredients_batch(self, ingredient_lists, num_recommendations, mode="default",
+                                    chunk_size=4096, workers=1):
+        """
+        複数の食材リストに対する推薦をまとめて計算し、入力と同じ順序でリストを返す。
+        chunk_size 件ずつ1回の疎行列積で処理し、workers が2以上ならチャンクをプロセスプールで並列に処理する。
+        mode に関連度（"ppmi", "jaccard", "lift"）を指定すると recommend_associated_ingredients と同じ順位付けになる。
+        """
+        with profiled("recommend_batch"), self.metrics.stage("query.recommend_batch"):
+            results = self._recommend_ingredients_batch(ingredient_lists, num_recommendations, mode, chunk_size,
+                                                        workers)
+        self.metrics.increment("queries", len(ingredient_lists))
+        return results
+
+    def _recommend_ingredients_batch(self, ingredient_lists, num_recommendations, mode, chunk_size, workers):
+        names = self.store.vocabulary.names
+        id_lists = [self.lookup_ingredients(ingredients) for ingredients in ingredient_lists]
+        if mode in ASSOCIATION_MEASURES:
+            # 上位リストを合わせるだけなので、行列積やプロセスプールを使わずに1件ずつ処理する
+            index = self.association_index(mode)
+            return [[names[i] for i in index.recommend(query_ids, num_recommendations)[0].tolist()]
+                    for query_ids in id_lists]
+
+        engine = self.engine
+        tasks = [(id_lists[start:start + chunk_size], num_recommendations, mode)
+                 for start in range(0, len(id_lists), chunk_size)]
+
+        if workers <= 1 or len(tasks) <= 1:
+            results = [engine.recommend_batch(*task) for task in tasks]
+        else:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # fork できる環境では隣接行列をコピーせずにワーカーと共有する
+            context = multiprocessing.get_context(
+                "fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_batch_worker, initargs=(engine,)) as executor:
+                results = list(executor.map(_recommend_batch_in_worker, tasks))
+
+        return [[names[index] for index in recommended.tolist()]
+                for chunk in results for recommended in chunk]
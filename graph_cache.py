@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from association import AssociationIndex
+from cooccurrence import CooccurrenceStore, Vocabulary
+
+
+class StaleCacheError(Exception):
+    """
+    キャッシュの形式や作成条件が現在の設定と一致しないことを表す例外。
+    """
+
+
+def recipe_digest(recipe_ids):
+    """
+    レシピIDの集合から順序に依存しないハッシュ値を計算する。
+    各IDのハッシュの和（mod 2^128）なので、レシピの追加・削除に合わせて差分で更新できる。
+    """
+    total = 0
+    for recipe_id in recipe_ids:
+        total += int.from_bytes(hashlib.sha1(repr(recipe_id).encode("utf-8")).digest()[:16], "big")
+    return total % (1 << 128)
+
+
+def combine_digests(a, b, sign=1):
+    return (a + sign * b) % (1 << 128)
+
+
+def node_stats(csr):
+    """
+    ノードごとの統計量を計算する。degree はNetworkXと同様に自己ループを2回数える。
+    """
+    diagonal = csr.diagonal()
+    degree = np.diff(csr.indptr).astype(np.int64) + (diagonal != 0)
+    strength = np.asarray(csr.sum(axis=1)).ravel().astype(np.int64) + diagonal.astype(np.int64)
+    return {"degree": degree, "strength": strength}
+
+
+class GraphCache:
+    """
+    共起グラフのキャッシュ。NumPy配列（語彙、CSRの indptr/indices/weights、ノード統計量）を
+    ディレクトリに保存し、読み込み時はメモリマップするため、複数プロセスでページを共有できる。
+    header.json に形式のバージョン・元レシピのハッシュ・正規化バックエンドの情報を持ち、
+    条件が一致しないキャッシュは StaleCacheError として検出する。
+
+    書き込みのたびに path の下に新しいバージョンのディレクトリを作り、最後に current ファイルを
+    アトミックに置き換えて切り替える。読み込み側は current を1度だけ解決し、以降はそのディレクトリだけを読む。
+    （current がなく path の直下に header.json がある場合は、以前の形式としてそのまま読む）
+    """
+
+    FORMAT_VERSION = 1
+    ARRAYS = ("indptr", "indices", "weights", "node_counts", "degree", "strength")
+    POINTER = "current"
+    # 古いバージョンは、次のバージョンに切り替わってからこの秒数が経つまで残す（読み込み中のプロセスのため）
+    RETENTION_SECONDS = 300
+
+    def __init__(self, path):
+        self.path = path
+        # 読み込みに使うバージョンのディレクトリ（最初に参照したときに解決して固定する）
+        self.version_path = None
+
+    @property
+    def pointer_path(self):
+        return os.path.join(self.path, self.POINTER)
+
+    def resolve(self):
+        """
+        現在のバージョンのディレクトリを返す。キャッシュがなければ None。
+        """
+        try:
+            with open(self.pointer_path, encoding="utf-8") as f:
+                return os.path.join(self.path, f.read().strip())
+        except FileNotFoundError:
+            pass
+        if os.path.exists(os.path.join(self.path, "header.json")):
+            return self.path
+        return None
+
+    @property
+    def directory(self):
+        if self.version_path is None:
+            self.version_path = self.resolve() or self.path
+        return self.version_path
+
+    @property
+    def header_path(self):
+        return os.path.join(self.directory, "header.json")
+
+    def exists(self):
+        path = self.resolve()
+        return path is not None and os.path.exists(os.path.join(path, "header.json"))
+
+    def current_version(self):
+        # 現在のバージョンを識別する値（書き込まれるたびに変わる）。キャッシュがなければ None
+        path = self.resolve()
+        header_path = os.path.join(path, "header.json") if path is not None else None
+        if header_path is None or not os.path.exists(header_path):
+            return None
+        return path, os.path.getmtime(header_path)
+
+    def read_header(self):
+        with open(self.header_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def validate(self, header, source_hash=None, translator=None):
+        """
+        ヘッダが現在の条件と一致するかを確認し、一致しない場合は StaleCacheError を送出する。
+        """
+        if header.get("format_version") != self.FORMAT_VERSION:
+            raise StaleCacheError(
+                f"形式のバージョンが異なります: {header.get('format_version')} != {self.FORMAT_VERSION}")
+        if source_hash is not None and header.get("source_hash") != source_hash:
+            raise StaleCacheError("元のレシピが変更されています。")
+        if translator is not None and header.get("translator") != translator:
+            raise StaleCacheError(f"正規化バックエンドが異なります: {header.get('translator')} != {translator}")
+
+    def write(self, store, associations=None, extras=None, **metadata):
+        """
+        ストアをキャッシュとして新しいバージョンのディレクトリに書き込み、current を切り替える。
+        読み込み中のプロセスが書きかけのキャッシュや、バージョンの混ざったキャッシュを見ることはない。
+        associations に {関連度: AssociationIndex} を渡すと、関連度の上位リストも一緒に保存する。
+        extras に {ファイル名: オブジェクト} を渡すと、pickleにして同じバージョンに保存する（レシピの索引など）。
+        """
+        csr = store.csr()
+        store.compact()
+        stats = node_stats(csr)
+        arrays = {
+            "indptr": csr.indptr.astype(np.int64),
+            "indices": csr.indices.astype(np.int32),
+            "weights": csr.data.astype(np.int64),
+            "node_counts": np.asarray(store.node_counts, dtype=np.int64),
+            "degree": stats["degree"],
+            "strength": stats["strength"],
+        }
+        for measure, index in (associations or {}).items():
+            for name, array in index.arrays().items():
+                arrays[f"association_{measure}_{name}"] = array
+        header = {
+            "format_version": self.FORMAT_VERSION,
+            "created_at": time.time(),
+            "num_nodes": int(len(store.active_nodes())),
+            "num_edges": store.number_of_edges(),
+            "vocabulary_size": len(store.vocabulary),
+            "recipe_count": store.number_of_recipes(),
+            "associations": {measure: index.top_k for measure, index in (associations or {}).items()},
+        }
+        header.update(metadata)
+        # グラフの内容を識別するバージョン（分析結果のキャッシュの無効化に使う）
+        header["graph_version"] = hashlib.sha1(
+            json.dumps([header["format_version"], header.get("source_hash"), header.get("translator"),
+                        header["num_edges"], header["vocabulary_size"]], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        version = f"v{time.time_ns()}-{os.getpid()}-{header['graph_version'][:8]}"
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = os.path.join(self.path, f"tmp-{version}")
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "vocabulary.json"), mode="w", encoding="utf-8") as f:
+            json.dump(store.vocabulary.names, f, ensure_ascii=False)
+        for name, value in (extras or {}).items():
+            with open(os.path.join(tmp_path, name), mode="wb") as f:
+                pickle.dump(value, f)
+        # ヘッダは最後に書く（ヘッダがあれば配列は揃っている）
+        with open(os.path.join(tmp_path, "header.json"), mode="w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, version))
+
+        # current を置き換えて新しいバージョンに切り替える
+        pointer_tmp_path = f"{self.pointer_path}.tmp-{os.getpid()}"
+        with open(pointer_tmp_path, mode="w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(pointer_tmp_path, self.pointer_path)
+        self.version_path = os.path.join(self.path, version)
+        self.remove_old_versions(version)
+        return header
+
+    def remove_old_versions(self, current):
+        """
+        切り替わってから RETENTION_SECONDS 秒以上経った古いバージョンと、以前の形式のファイルを削除する。
+        バージョン名の先頭は作成時刻（ナノ秒）なので、次のバージョンの作成時刻が切り替わった時刻になる。
+        """
+        versions = sorted(name for name in os.listdir(self.path)
+                          if name.startswith("v") and os.path.isdir(os.path.join(self.path, name)))
+        now = time.time_ns()
+        for name, successor in zip(versions, versions[1:]):
+            superseded_at = int(successor[1:].split("-")[0])
+            if name != current and now - superseded_at > self.RETENTION_SECONDS * 1_000_000_000:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        for name in os.listdir(self.path):
+            # 以前の形式（path の直下に配列を置いていた）のキャッシュ
+            if name.endswith(".npy") or name in ("vocabulary.json", "header.json", "recipe_index.pickle"):
+                os.remove(os.path.join(self.path, name))
+
+    def load(self, source_hash=None, translator=None, mmap=True):
+        """
+        キャッシュを読み込み、(ストア, ヘッダ, ノード統計量) を返す。
+        """
+        # current を解決し直し、以降の読み込み（関連度・付随データを含む）はすべてこのバージョンから行う
+        self.version_path = self.resolve() or self.path
+        header = self.read_header()
+        self.validate(header, source_hash=source_hash, translator=translator)
+
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in self.ARRAYS}
+        with open(os.path.join(self.directory, "vocabulary.json"), encoding="utf-8") as f:
+            vocabulary = Vocabulary(json.load(f))
+
+        n = len(vocabulary)
+        csr = sp.csr_matrix((arrays["weights"], arrays["indices"], arrays["indptr"]), shape=(n, n), copy=False)
+        store = CooccurrenceStore.from_csr(vocabulary, csr, arrays["node_counts"], header.get("recipe_count", 0))
+        stats = {"degree": arrays["degree"], "strength": arrays["strength"]}
+        return store, header, stats
+
+    def load_associations(self, header, mmap=True):
+        """
+        キャッシュに保存されている関連度の上位リストを {関連度: AssociationIndex} として読み込む。
+        """
+        mmap_mode = "r" if mmap else None
+        associations = {}
+        for measure, top_k in header.get("associations", {}).items():
+            arrays = {name: np.load(os.path.join(self.directory, f"association_{measure}_{name}.npy"),
+                                    mmap_mode=mmap_mode)
+                      for name in AssociationIndex.ARRAYS}
+            associations[measure] = AssociationIndex.from_arrays(measure, arrays, top_k)
+        return associations
+
+    def extra_path(self, name):
+        # グラフと同じバージョンに保存した付随データ（レシピの索引など）のパス
+        return os.path.join(self.directory, name)
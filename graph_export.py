@@ -0,0 +1,281 @@
+import argparse
+import json
+import math
+import os
+import shutil
+from string import Template
+
+import numpy as np
+import scipy.sparse as sp
+
+from community_detection import csr_edges
+
+# vis-network などのブラウザ用ライブラリ（pyvisが出力するHTMLと同じもの）
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib")
+VIS_LIBRARY = "vis-9.1.2"
+VIEW_MODES = ("ego", "backbone", "communities")
+# レイアウトの座標の範囲（vis-network のピクセル単位）
+LAYOUT_SCALE = 1000
+
+
+def upper_edges(adjacency):
+    # 対称な隣接行列の上三角成分（自己ループを除く）の (行, 列, 重み)
+    rows, cols, data = csr_edges(adjacency)
+    upper = rows < cols
+    return rows[upper], cols[upper], np.asarray(data[upper], dtype=np.float64)
+
+
+def top_edges(rows, cols, weights, max_edges):
+    # 重みの大きい順に max_edges 本だけ残す（同じ重みなら端点のIDの小さい順）
+    order = np.lexsort((cols, rows, -weights))[:max_edges]
+    return rows[order], cols[order], weights[order]
+
+
+def induced_edges(adjacency, node_ids):
+    # node_ids の間のエッジだけを (行, 列, 重み) で返す
+    rows, cols, weights = upper_edges(adjacency)
+    selected = np.zeros(adjacency.shape[0], dtype=bool)
+    selected[node_ids] = True
+    keep = selected[rows] & selected[cols]
+    return rows[keep], cols[keep], weights[keep]
+
+
+def compute_layout(number_of_nodes, sources, targets, weights, seed=42):
+    """
+    ばねモデルで座標を計算する。ブラウザで物理シミュレーションを動かさずに済むよう、ここで位置を決めておく。
+    """
+    import networkx as nx
+
+    graph = nx.Graph()
+    graph.add_nodes_from(range(number_of_nodes))
+    # 重みの対数を引力に使い、重みの大きいエッジに引っ張られすぎないようにする
+    graph.add_weighted_edges_from(zip(sources.tolist(), targets.tolist(), np.log1p(weights).tolist()))
+    positions = nx.spring_layout(graph, weight="weight", seed=seed, iterations=100)
+    coordinates = np.array([positions[node] for node in range(number_of_nodes)]).reshape(-1, 2)
+    return np.rint(coordinates * LAYOUT_SCALE).astype(np.int64)
+
+
+class GraphView:
+    """
+    ブラウザで表示する部分グラフ。ノードとエッジの属性を列ごとの配列で持ち、
+    エッジの端点はノードの配列の位置で表すため、JSONが小さくなる。
+    """
+
+    def __init__(self, mode, labels, groups, sizes, roles, sources, targets, weights, metadata=None, seed=42):
+        self.mode = mode
+        self.labels = list(labels)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self.roles = list(roles)
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.metadata = metadata or {}
+        self.positions = compute_layout(len(self.labels), self.sources, self.targets, self.weights, seed)
+
+    @classmethod
+    def from_node_ids(cls, mode, store, node_ids, communities, strength, edges, roles=None, metadata=None):
+        """
+        ストアのノードIDとエッジ (行, 列, 重み) から作る。ノードの大きさは重み付き次数の対数にする。
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        positions = np.full(len(store.vocabulary), -1, dtype=np.int64)
+        positions[node_ids] = np.arange(len(node_ids))
+        rows, cols, weights = edges
+        names = store.vocabulary.names
+        return cls(mode, [names[index] for index in node_ids.tolist()], communities[node_ids],
+                   np.log1p(strength[node_ids]), roles or ["node"] * len(node_ids),
+                   positions[rows], positions[cols], weights, metadata)
+
+    def to_dict(self):
+        return {
+            "mode": self.mode,
+            "metadata": self.metadata,
+            "nodes": {
+                "label": self.labels,
+                "group": self.groups.tolist(),
+                "size": np.round(self.sizes, 2).tolist(),
+                "role": self.roles,
+                "x": self.positions[:, 0].tolist(),
+                "y": self.positions[:, 1].tolist(),
+            },
+            "edges": {
+                "from": self.sources.tolist(),
+                "to": self.targets.tolist(),
+                "weight": [int(weight) if float(weight).is_integer() else round(float(weight), 3)
+                           for weight in self.weights.tolist()],
+            },
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+
+def ego_view(store, query_ids, communities, strength, recommended_ids=(), max_nodes=150, max_edges=1000):
+    """
+    クエリの材料と、その隣接ノードのうちクエリとの重みの合計が大きいものからなる部分グラフ。
+    推薦された材料は必ず含め、推薦の理由を確かめられるようにする。
+    """
+    adjacency = store.csr()
+    query_ids = np.unique(np.asarray(query_ids, dtype=np.int64))
+    recommended_ids = np.setdiff1d(np.asarray(recommended_ids, dtype=np.int64), query_ids)
+    # クエリの各材料との重みの合計で隣接ノードを並べる
+    query = sp.csr_matrix((np.ones(len(query_ids)), (np.zeros(len(query_ids), dtype=np.int64), query_ids)),
+                          shape=(1, adjacency.shape[0]))
+    neighbor_weights = (query @ adjacency).tocsr()
+    candidates = neighbor_weights.indices.astype(np.int64)
+    scores = neighbor_weights.data
+    fixed = np.concatenate([query_ids, recommended_ids])
+    keep = ~np.isin(candidates, fixed)
+    candidates, scores = candidates[keep], scores[keep]
+    limit = max(max_nodes - len(fixed), 0)
+    neighbors = candidates[np.lexsort((candidates, -scores))[:limit]]
+
+    node_ids = np.concatenate([fixed, neighbors])
+    roles = ["query"] * len(query_ids) + ["recommended"] * len(recommended_ids) + ["neighbor"] * len(neighbors)
+    edges = top_edges(*induced_edges(adjacency, node_ids), max_edges)
+    return GraphView.from_node_ids("ego", store, node_ids, communities, strength, edges, roles,
+                                   {"query": [store.vocabulary.names[index] for index in query_ids.tolist()]})
+
+
+def backbone_view(store, communities, strength, max_edges=2000):
+    """
+    グラフ全体から重みの大きいエッジだけを max_edges 本残した骨格。
+    """
+    rows, cols, weights = top_edges(*upper_edges(store.csr()), max_edges)
+    node_ids = np.unique(np.concatenate([rows, cols]))
+    return GraphView.from_node_ids("backbone", store, node_ids, communities, strength, (rows, cols, weights),
+                                   metadata={"total_edges": store.number_of_edges()})
+
+
+def community_view(store, communities, strength, max_edges=500, top_members=3):
+    """
+    コミュニティを1つのノードにまとめたグラフ。ノードの大きさはメンバー数、
+    エッジの重みはコミュニティ間の共起回数の合計、ラベルは重み付き次数の大きい代表的な材料。
+    """
+    active = store.active_nodes()
+    active = active[communities[active] >= 0]
+    labels = communities[active]
+    community_ids, labels = np.unique(labels, return_inverse=True)
+    number_of_communities = len(community_ids)
+
+    rows, cols, weights = upper_edges(store.csr())
+    position = np.full(len(store.vocabulary), -1, dtype=np.int64)
+    position[active] = labels
+    source, target = position[rows], position[cols]
+    between = (source >= 0) & (target >= 0) & (source != target)
+    aggregated = sp.coo_matrix((weights[between], (np.minimum(source[between], target[between]),
+                                                    np.maximum(source[between], target[between]))),
+                               shape=(number_of_communities, number_of_communities)).tocsr()
+    aggregated.sum_duplicates()
+    edges = top_edges(*upper_edges(aggregated + aggregated.T), max_edges)
+
+    names = store.vocabulary.names
+    members = np.bincount(labels, minlength=number_of_communities)
+    order = np.lexsort((-strength[active], labels))
+    starts = np.searchsorted(labels[order], np.arange(number_of_communities))
+    titles = [", ".join(names[index] for index in active[order[start:start + top_members]].tolist())
+              for start in starts.tolist()]
+    return GraphView("communities", titles, community_ids, np.log1p(members), ["community"] * number_of_communities,
+                     *edges, metadata={"members": members.tolist()})
+
+
+HTML_TEMPLATE = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<link rel="stylesheet" href="lib/$vis/vis-network.css">
+<script src="lib/$vis/vis-network.min.js"></script>
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  #network { width: 100vw; height: 100vh; }
+  #status { position: absolute; top: 8px; left: 8px; background: rgba(255, 255, 255, 0.8); padding: 4px 8px; }
+</style>
+</head>
+<body>
+<div id="status">Loading $data ...</div>
+<div id="network"></div>
+<script>
+// 座標は計算済みなので物理シミュレーションは使わない。データは同じディレクトリのJSONから読み込む
+// （file:// で開くとブラウザによっては読み込めないため、出力先のディレクトリで python -m http.server などを実行して配信する）
+fetch("$data").then(function (response) { return response.json(); }).then(function (view) {
+  var nodes = view.nodes, edges = view.edges;
+  var roleColors = { query: "#d62728", recommended: "#2ca02c" };
+  var nodeItems = nodes.label.map(function (label, i) {
+    var item = { id: i, label: label, group: nodes.group[i], x: nodes.x[i], y: nodes.y[i],
+                 value: nodes.size[i], title: label + " (" + nodes.role[i] + ", community " + nodes.group[i] + ")" };
+    if (roleColors[nodes.role[i]]) { item.color = roleColors[nodes.role[i]]; }
+    return item;
+  });
+  var edgeItems = edges.from.map(function (source, i) {
+    return { from: source, to: edges.to[i], value: edges.weight[i], title: String(edges.weight[i]) };
+  });
+  new vis.Network(document.getElementById("network"),
+    { nodes: new vis.DataSet(nodeItems), edges: new vis.DataSet(edgeItems) },
+    { physics: false, layout: { improvedLayout: false },
+      nodes: { shape: "dot", scaling: { min: 4, max: 30 }, font: { size: 12 } },
+      edges: { smooth: false, color: { opacity: 0.4 }, scaling: { min: 1, max: 8 } },
+      interaction: { hideEdgesOnDrag: true, hideEdgesOnZoom: true, tooltipDelay: 100 } });
+  document.getElementById("status").textContent =
+    view.mode + ": " + nodeItems.length + " nodes, " + edgeItems.length + " edges";
+}).catch(function (error) {
+  document.getElementById("status").textContent = "Failed to load $data: " + error;
+});
+</script>
+</body>
+</html>
+""")
+
+
+def write_view(view, output_dir=".", name=None):
+    """
+    ビューを {name}.json と、それを読み込んで表示する {name}.html として保存し、両方のパスを返す。
+    HTMLには描画のコードだけを書き、ノードとエッジはJSONに分ける。
+    vis-network は output_dir/lib にコピーするので、output_dir をそのままHTTPで配信すれば表示できる。
+    """
+    name = name or f"graph_{view.mode}"
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, f"{name}.json")
+    html_path = os.path.join(output_dir, f"{name}.html")
+    with open(json_path, mode="w", encoding="utf-8") as f:
+        f.write(view.to_json())
+    vis_dir = os.path.join(output_dir, "lib", VIS_LIBRARY)
+    if not os.path.exists(os.path.join(vis_dir, "vis-network.min.js")):
+        shutil.copytree(os.path.join(LIB_DIR, VIS_LIBRARY), vis_dir, dirs_exist_ok=True)
+    with open(html_path, mode="w", encoding="utf-8") as f:
+        f.write(HTML_TEMPLATE.substitute(title=name, vis=VIS_LIBRARY, data=os.path.basename(json_path)))
+    return html_path, json_path
+
+
+def main():
+    from creategraph import CreateGraph
+    from graphAnalyzer import GraphAnalyzer
+
+    parser = argparse.ArgumentParser(description="共起グラフの一部をブラウザで表示できる形式で書き出す")
+    parser.add_argument("mode", choices=VIEW_MODES, help="ego: 材料の周辺, backbone: 重みの大きいエッジ, "
+                                                          "communities: コミュニティ単位")
+    parser.add_argument("--ingredients", default="", help="ego で中心にする材料（カンマ区切り）")
+    parser.add_argument("--recommendations", type=int, default=10, help="ego で強調する推薦の件数")
+    parser.add_argument("--max-nodes", type=int, default=150, help="ego のノード数の上限")
+    parser.add_argument("--max-edges", type=int, default=2000, help="エッジ数の上限")
+    parser.add_argument("--recipes", type=int, default=10000, help="グラフのレシピ数")
+    parser.add_argument("--output-dir", default=".", help="HTMLとJSONの出力先")
+    parser.add_argument("--name", help="出力ファイル名（拡張子なし）")
+    args = parser.parse_args()
+
+    graph_builder = CreateGraph(number_of_recipes=args.recipes)
+    graph_builder.build_graph()
+    analyzer = GraphAnalyzer.from_graph_builder(graph_builder)
+    ingredients = [ingredient for ingredient in args.ingredients.split(",") if ingredient]
+    html_path, json_path = analyzer.export_view(
+        args.mode, ingredients, output_dir=args.output_dir, name=args.name, max_nodes=args.max_nodes,
+        max_edges=args.max_edges, recommendations=args.recommendations)
+    print(f"{html_path} ({math.ceil(os.path.getsize(json_path) / 1024)} KiB of data in {json_path})")
+
+
+# 使い方:
+# python graph_export.py ego --ingredients beef,rice --output-dir views
+# python graph_export.py backbone --max-edges 3000
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# キャッシュ済みのグラフで推薦するだけなら読み込まれないはずのモジュール
+HEAVY_MODULES = ("networkx", "pyvis", "tqdm", "cookpad", "MeCab", "googletrans", "sqlite3")
+# 推薦のために読み込むモジュール
+QUERY_PATH_MODULES = ("creategraph", "graphAnalyzer")
+
+
+def measure_startup(modules=QUERY_PATH_MODULES):
+    """
+    python -X importtime で modules を読み込み、読み込まれたモジュールとその時間を測る。
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                               cwd=package_dir, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+
+    # 各行は "import time: self [us] | cumulative | imported package"
+    imported = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imported.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    top_level = sorted(((name.strip(), cumulative) for name, _, cumulative in imported
+                        if not name.startswith("  ")), key=lambda item: item[1], reverse=True)
+    packages = {name.strip().split(".")[0] for name, _, _ in imported}
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": sum(self_us for _, self_us, _ in imported) / 1000,
+        "top_modules_ms": {name: cumulative / 1000 for name, cumulative in top_level[:10]},
+        "heavy_modules": [name for name in HEAVY_MODULES if name in packages],
+    }
+
+
+def check_startup(startup, max_import_ms=None):
+    # 回帰していればその内容を、問題なければ空のリストを返す
+    problems = []
+    if startup["heavy_modules"]:
+        problems.append(f"heavy modules imported: {', '.join(startup['heavy_modules'])}")
+    if max_import_ms is not None and startup["import_ms"] > max_import_ms:
+        problems.append(f"import took {startup['import_ms']:.1f} ms (limit {max_import_ms} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推薦の経路で重い依存モジュールを読み込んでいないか確認する")
+    parser.add_argument("--max-import-ms", type=float, help="読み込み時間の上限（ミリ秒）")
+    args = parser.parse_args()
+
+    startup = measure_startup()
+    print(f"Startup: import {startup['import_ms']:.1f} ms, wall {startup['wall_ms']:.1f} ms")
+    problems = check_startup(startup, args.max_import_ms)
+    for problem in problems:
+        print(f"Startup regression: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+# 使い方（終了コードが0以外なら回帰）:
+# python import_check.py --max-import-ms 500
+if __name__ == "__main__":
+    sys.exit(main())
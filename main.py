@@ -1,20 +1,15 @@
 from creategraph import CreateGraph
 from graphAnalyzer import GraphAnalyzer
-import community  # Louvain method
-from networkx.algorithms import community
 
 
 # オブジェクト生成
 graph_builder = CreateGraph()
 
-#recipeの読み込み
-graph_builder.load_recipes_from_cookpad()
-
-#graphの作成
+#graphの作成（キャッシュがない場合のみレシピを読み込む）
 graph_builder.build_graph()
 
 # 分析用のオブジェクト生成
-analyzer = GraphAnalyzer(graph_builder.G)
+analyzer = GraphAnalyzer.from_graph_builder(graph_builder)
 # print(analyzer.get_most_common_ingredients())
 
 # 指定したノードの最短パスを取得
@@ -1,6 +1,106 @@
 import sys
-from creategraph import CreateGraph
-from graphAnalyzer import GraphAnalyzer
+import json
+import itertools
+
+
+BATCH_MODES = ("default", "cooccurring")
+
+
+def parse_query(line, modes):
+    """
+    JSONLの1行を検証して {"ingredients": [...], "n": 10, "mode": "default"} を含む辞書を返す。
+    不正な行は ValueError を送出する。
+    """
+    query = json.loads(line)
+    if not isinstance(query, dict):
+        raise ValueError("クエリはJSONのオブジェクトでなければなりません。")
+    ingredients = query.get("ingredients")
+    if not isinstance(ingredients, list) or not all(isinstance(ingredient, str) for ingredient in ingredients):
+        raise ValueError('"ingredients" には材料名のリストを指定してください。')
+    mode = query.get("mode", "default")
+    if mode not in modes:
+        raise ValueError(f"未知の推薦モードです: {mode}（{', '.join(modes)} のいずれか）")
+    n = query.get("n", 10)
+    if isinstance(n, bool) or not isinstance(n, int) or n < 0:
+        raise ValueError('"n" には0以上の整数を指定してください。')
+    return query
+
+
+def run_batch(argv):
+    """
+    JSONLのクエリ（1行に {"ingredients": [...], "n": 10, "mode": "default"}）を読み込み、
+    推薦結果をJSONLで出力する。クエリはまとめて疎行列積で処理する。
+    不正な行には {"line": 行番号, "error": "..."} を出力し、残りのクエリの処理を続ける。
+    """
+    import argparse
+    from association import ASSOCIATION_MEASURES
+    from creategraph import CreateGraph
+    from graphAnalyzer import GraphAnalyzer
+
+    parser = argparse.ArgumentParser(prog="main2.py --batch", description="材料推薦のバッチ処理")
+    parser.add_argument("input", nargs="?", default="-", help="入力のJSONLファイル（省略時は標準入力）")
+    parser.add_argument("--output", default="-", help="出力のJSONLファイル（省略時は標準出力）")
+    parser.add_argument("--workers", type=int, default=1, help="並列に処理するプロセス数")
+    parser.add_argument("--chunk-size", type=int, default=4096, help="1回の行列積で処理するクエリ数")
+    args = parser.parse_args(argv)
+    modes = BATCH_MODES + ASSOCIATION_MEASURES
+
+    # グラフの構築状況などは標準エラー出力に出るため、標準出力にはJSONLだけが書かれる
+    graph_builder = CreateGraph()
+    graph_builder.build_graph()
+    analyzer = GraphAnalyzer.from_graph_builder(graph_builder)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, mode="w", encoding="utf-8")
+    errors = 0
+    try:
+        lines = ((number, line) for number, line in enumerate(source, start=1) if line.strip())
+        # ワーカー数分のチャンクをまとめて読み込み、メモリ使用量を一定に保つ
+        block_size = args.chunk_size * max(args.workers, 1)
+        while True:
+            block = list(itertools.islice(lines, block_size))
+            if not block:
+                break
+            queries = [None] * len(block)
+            results = [None] * len(block)
+            for i, (number, line) in enumerate(block):
+                try:
+                    queries[i] = parse_query(line, modes)
+                except ValueError as e:
+                    # json.JSONDecodeError も ValueError のサブクラス
+                    results[i] = {"line": number, "error": str(e)}
+            for mode in dict.fromkeys(query.get("mode", "default") for query in queries if query is not None):
+                positions = [i for i, query in enumerate(queries)
+                             if query is not None and query.get("mode", "default") == mode]
+                k = max(queries[i].get("n", 10) for i in positions)
+                try:
+                    recommended = analyzer.recommend_ingredients_batch(
+                        [queries[i]["ingredients"] for i in positions], k, mode=mode,
+                        chunk_size=args.chunk_size, workers=args.workers)
+                except Exception as e:
+                    # 推薦に失敗した場合も、同じモードのクエリをエラーとして出力して続ける
+                    for i in positions:
+                        results[i] = dict(queries[i], error=str(e))
+                    continue
+                for i, items in zip(positions, recommended):
+                    results[i] = dict(queries[i], recommended=items[:queries[i].get("n", 10)])
+            for result in results:
+                if "error" in result:
+                    errors += 1
+                sink.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    if errors:
+        print(f"{errors} 件のクエリを処理できませんでした。", file=sys.stderr)
+
+
+# バッチモード: python main2.py --batch queries.jsonl --workers 4 > results.jsonl
+if len(sys.argv) >= 2 and sys.argv[1] == "--batch":
+    run_batch(sys.argv[2:])
+    sys.exit(0)
 
 # コマンドライン引数を解析
 if len(sys.argv) != 3:
@@ -11,20 +111,38 @@ if len(sys.argv) != 3:
 ingredients_list = sys.argv[1].split(',')
 number_of_recommendations = int(sys.argv[2])
 
-# オブジェクト生成
-graph_builder = CreateGraph()
 
-# recipeの読み込み
-graph_builder.load_recipes_from_cookpad()
+def recommend_locally(ingredients, n):
+    # サーバが起動していない場合は、このプロセスでグラフを読み込んで推薦する
+    from creategraph import CreateGraph
+    from graphAnalyzer import GraphAnalyzer
+
+    # オブジェクト生成
+    graph_builder = CreateGraph()
 
-# graphの作成
-graph_builder.build_graph()
+    # graphの作成（キャッシュがない場合のみレシピを読み込む）
+    graph_builder.build_graph()
 
-# 分析用のオブジェクト生成
-analyzer = GraphAnalyzer(graph_builder.G)
+    # 分析用のオブジェクト生成
+    analyzer = GraphAnalyzer.from_graph_builder(graph_builder)
 
-# おすすめの食材を出力
-recommended = analyzer.recommend_ingredients(ingredients_list, number_of_recommendations)
+    # おすすめの食材を出力
+    return analyzer.recommend_ingredients(ingredients, n)
+
+
+from urllib.error import HTTPError
+
+try:
+    # 常駐している推薦サーバ（python recommend_server.py）に問い合わせる
+    from recommend_client import request_recommendations
+    recommended = request_recommendations(ingredients_list, number_of_recommendations)["recommended"]
+except HTTPError as e:
+    # サーバには接続できたがエラーが返った場合は、グラフを読み込み直さずにエラーを報告する
+    print(f"推薦サーバがエラーを返しました: {e.code} {e.read().decode('utf-8', errors='replace')}", file=sys.stderr)
+    sys.exit(1)
+except OSError:
+    # サーバに接続できない場合だけ、このプロセスで推薦する
+    recommended = recommend_locally(ingredients_list, number_of_recommendations)
 
 # 入力されたingredientsとおすすめの食材を結合
 combined_list = ingredients_list + recommended
@@ -34,3 +152,5 @@ print(combined_list)
 
 # スクリプト実行時には次のようにコマンドラインから実行します:
 # python script.py beef,rice 10
+# 推薦サーバを起動しておくと、グラフの読み込みを省いてすぐに答えが返ります:
+# python recommend_server.py --port 8765
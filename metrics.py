@@ -0,0 +1,199 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from cache_settings import default_cache_root
+
+# プロファイルを取る処理の種類（"cprofile", "tracemalloc" をカンマ区切りで指定）
+PROFILE_ENV = "RECIPE_PROFILE"
+# プロファイルの出力先（指定がなければキャッシュのルートの profiles ディレクトリ）
+PROFILE_DIR_ENV = "RECIPE_PROFILE_DIR"
+
+
+class Metrics:
+    """
+    処理段階ごとの時間と件数を集計する。
+    stage() で囲んだ区間の回数・合計時間・最大時間と、increment() で数えたカウンタを保持し、
+    JSONまたはPrometheusのテキスト形式で出力できる。1回の記録は perf_counter とロック1回分のコストで済む。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 段階名 -> [回数, 合計秒, 最大秒]
+        self.timers = {}
+        # カウンタ名 -> 値
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def stage(self, name):
+        # with文で囲んだ区間の時間を name の段階として記録する
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        現在の集計結果を辞書で返す（プロセス間で受け渡したり、JSONに保存したりできる）。
+        """
+        with self._lock:
+            return {
+                "timers": {name: {"count": count, "seconds": total, "max_seconds": longest}
+                           for name, (count, total, longest) in self.timers.items()},
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, snapshot):
+        """
+        別の Metrics（ワーカープロセスなど）の snapshot() を加算する。
+        """
+        with self._lock:
+            for name, timer in snapshot.get("timers", {}).items():
+                current = self.timers.setdefault(name, [0, 0.0, 0.0])
+                current[0] += timer["count"]
+                current[1] += timer["seconds"]
+                current[2] = max(current[2], timer["max_seconds"])
+            for name, value in snapshot.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def rate(self, counter, stage):
+        # カウンタを段階の合計時間で割った1秒あたりの件数（レシピ/秒など）
+        with self._lock:
+            timer = self.timers.get(stage)
+            if timer is None or timer[1] == 0:
+                return 0.0
+            return self.counters.get(counter, 0) / timer[1]
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), ensure_ascii=False, **kwargs)
+
+    def write_json(self, path):
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            f.write(self.to_json(indent=2))
+        os.replace(tmp_path, path)
+
+    def to_prometheus(self, prefix="recipe"):
+        """
+        Prometheusのテキスト形式で出力する。段階は stage ラベル付きの
+        {prefix}_stage_seconds_total / {prefix}_stage_calls_total / {prefix}_stage_max_seconds、
+        カウンタは {prefix}_{カウンタ名}_total になる。
+        """
+        snapshot = self.snapshot()
+        lines = []
+        if snapshot["timers"]:
+            for metric, key, kind in (("stage_seconds_total", "seconds", "counter"),
+                                      ("stage_calls_total", "count", "counter"),
+                                      ("stage_max_seconds", "max_seconds", "gauge")):
+                lines.append(f"# TYPE {prefix}_{metric} {kind}")
+                for name, timer in sorted(snapshot["timers"].items()):
+                    lines.append(f'{prefix}_{metric}{{stage="{name}"}} {timer[key]}')
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{prefix}_{sanitize_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def sanitize_metric_name(name):
+    # Prometheusのメトリクス名に使えない文字を _ に置き換える
+    return "".join(char if char.isalnum() or char == "_" else "_" for char in name)
+
+
+# プロセス内で共有する既定の Metrics
+_default_metrics = Metrics()
+
+
+def get_default_metrics():
+    return _default_metrics
+
+
+# プロファイルを取り終えた処理の名前（同じ処理は1プロセスにつき1回だけ取る）
+_profiled_names = set()
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(name):
+    """
+    環境変数 RECIPE_PROFILE が設定されている場合だけ、with文で囲んだ処理の
+    cProfile と tracemalloc の結果を RECIPE_PROFILE_DIR に保存する。
+    同じ name の処理はプロセスごとに最初の1回だけ計測するため、常駐サーバで有効にしても出力は増え続けない。
+    """
+    modes = {mode.strip() for mode in os.environ.get(PROFILE_ENV, "").split(",") if mode.strip()}
+    if not modes:
+        yield
+        return
+    with _profile_lock:
+        if name in _profiled_names:
+            modes = set()
+        _profiled_names.add(name)
+    if not modes:
+        yield
+        return
+
+    profiler = None
+    if "cprofile" in modes:
+        import cProfile
+        profiler = cProfile.Profile()
+    tracing = "tracemalloc" in modes
+    if tracing:
+        import tracemalloc
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        memory = None
+        if tracing:
+            memory = (tracemalloc.take_snapshot(), tracemalloc.get_traced_memory())
+            tracemalloc.stop()
+        write_profile(name, profiler, memory)
+
+
+def write_profile(name, profiler, memory):
+    # cProfile の結果（.prof と上位の関数）と tracemalloc の上位の確保箇所を保存する
+    import io
+    import pstats
+
+    output_dir = os.environ.get(PROFILE_DIR_ENV) or os.path.join(default_cache_root(), "profiles")
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, f"{sanitize_metric_name(name)}-{os.getpid()}-{int(time.time())}")
+    report = io.StringIO()
+    if profiler is not None:
+        profiler.dump_stats(f"{base_path}.prof")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(30)
+    if memory is not None:
+        snapshot, (current, peak) = memory
+        report.write(f"\ntracemalloc: current {current / 1024 / 1024:.1f} MiB, peak {peak / 1024 / 1024:.1f} MiB\n")
+        for statistic in snapshot.statistics("lineno")[:20]:
+            report.write(f"{statistic}\n")
+    with open(f"{base_path}.txt", mode="w", encoding="utf-8") as f:
+        f.write(report.getvalue())
+    print(f"Profile written to {base_path}.txt", file=sys.stderr)
@@ -0,0 +1,21 @@
+import json
+import os
+from urllib.request import Request, urlopen
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 推薦サーバのURL（環境変数 RECOMMEND_SERVER_URL で変更できる）
+SERVER_URL_ENV = "RECOMMEND_SERVER_URL"
+DEFAULT_SERVER_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+def request_recommendations(ingredients, number_of_recommendations, mode="default", url=None, timeout=5.0):
+    """
+    常駐している推薦サーバに問い合わせる。サーバに接続できない場合は OSError を送出する。
+    グラフ関連のモジュールを読み込まないので、CLIからすぐに呼び出せる。
+    """
+    url = url or os.environ.get(SERVER_URL_ENV, DEFAULT_SERVER_URL)
+    body = json.dumps({"ingredients": ingredients, "n": number_of_recommendations, "mode": mode}).encode("utf-8")
+    request = Request(f"{url}/recommend", data=body, headers={"Content-Type": "application/json"})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -0,0 +1,219 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from association import ASSOCIATION_MEASURES
+from community_detection import COMMUNITY_ALGORITHMS
+from creategraph import CreateGraph
+from graph_cache import GraphCache, StaleCacheError
+from graphAnalyzer import GraphAnalyzer
+from metrics import get_default_metrics
+from recommend_client import DEFAULT_HOST, DEFAULT_PORT
+
+
+class RecommendationService:
+    """
+    グラフと分析結果を1度だけ読み込んで常駐し、推薦のリクエストに答える。
+    グラフキャッシュが作り直されたら、新しいキャッシュを読み込んで差し替える。
+    グラフを構築するのは起動時にキャッシュがない場合だけで、再読み込みではキャッシュを読むだけにする。
+    """
+
+    def __init__(self, number_of_recipes=10000, translator_backend="google", translator_options=None,
+                 cache_root=None, reload_interval=30.0, community_algorithm="louvain", tokenizer="mecab"):
+        self.graph_options = {
+            "number_of_recipes": number_of_recipes,
+            "translator_backend": translator_backend,
+            "translator_options": translator_options,
+            "cache_root": cache_root,
+            "tokenizer": tokenizer,
+        }
+        self.reload_interval = reload_interval
+        self.community_algorithm = community_algorithm
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.analyzer = None
+        self.graph_version = None
+        # 読み込んだグラフキャッシュと、そのバージョン（更新の検出に使う）
+        self.cache = None
+        self.cache_version = None
+        # 読み込みに失敗したキャッシュのバージョン（同じバージョンを繰り返し読み込まないため）
+        self.failed_version = None
+        self.load(build=True)
+
+    def load(self, build=False):
+        """
+        グラフと分析結果を読み込む。読み込みが終わってから参照を差し替えるため、
+        処理中のリクエストは古いグラフのまま答える。
+        build=False のときはキャッシュを読むだけで、キャッシュがない・古い場合は
+        FileNotFoundError・StaleCacheError を送出する（レシピからの再構築やキャッシュの上書きはしない）。
+        """
+        graph_builder = CreateGraph(**self.graph_options)
+        number_of_recipes = graph_builder.number_of_recipes
+        if build:
+            graph_builder.build_graph()
+        elif graph_builder.isGraphCashAvailable(number_of_recipes):
+            graph_builder.load_graph_cache(number_of_recipes)
+        else:
+            raise FileNotFoundError(f"グラフのキャッシュがありません: {graph_builder.graph_cache_path(number_of_recipes)}")
+        analyzer = GraphAnalyzer.from_graph_builder(graph_builder, community_algorithm=self.community_algorithm)
+        # コミュニティと中心性は最初のリクエストより前に用意しておく
+        analyzer.ensure_analysis()
+
+        self.cache = GraphCache(graph_builder.graph_cache_path(number_of_recipes))
+        self.cache_version = self.cache.current_version()
+        self.graph_version = analyzer.graph_version
+        self.analyzer = analyzer
+        # ログのためだけにNetworkXのグラフを作らないよう、ノード数はストアから数える
+        print(f"Loaded graph {self.graph_version} ({len(analyzer.store.active_nodes())} nodes)")
+
+    def maybe_reload(self):
+        """
+        キャッシュのバージョンが切り替わっていれば新しいキャッシュを読み込む。
+        読み込めなかった場合はエラーを出力し、今のグラフのまま答え続ける。
+        """
+        if self.cache is None:
+            return False
+        version = self.cache.current_version()
+        if version is None or version in (self.cache_version, self.failed_version):
+            return False
+        with self._reload_lock:
+            version = self.cache.current_version()
+            if version is None or version in (self.cache_version, self.failed_version):
+                return False
+            try:
+                self.load()
+            except (FileNotFoundError, StaleCacheError) as e:
+                self.failed_version = version
+                print(f"Reload failed, keeping graph {self.graph_version}: {e}", file=sys.stderr)
+                return False
+        return True
+
+    def watch(self):
+        # reload_interval 秒ごとにグラフキャッシュの更新を確認する
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.maybe_reload()
+            except Exception as e:
+                print(f"Reload failed: {e}", file=sys.stderr)
+
+    def start_watching(self):
+        thread = threading.Thread(target=self.watch, name="graph-reloader", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def recommend(self, ingredients, number_of_recommendations, mode="default"):
+        analyzer = self.analyzer
+        if mode == "cooccurring":
+            recommended = analyzer.recommend_cooccurring_ingredients(ingredients, number_of_recommendations)
+        elif mode == "default":
+            recommended = analyzer.recommend_ingredients(ingredients, number_of_recommendations)
+        elif mode in ASSOCIATION_MEASURES:
+            recommended = analyzer.recommend_associated_ingredients(ingredients, number_of_recommendations, mode)
+        else:
+            raise ValueError(f"未知の推薦モードです: {mode}")
+        return {"ingredients": ingredients, "recommended": recommended, "graph_version": self.graph_version}
+
+
+class RecommendationRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /recommend に {"ingredients": [...], "n": 10, "mode": "default"} を送ると推薦結果をJSONで返す。
+    mode には "default", "cooccurring" のほか、関連度 "ppmi", "jaccard", "lift" を指定できる。
+    GET /health でグラフのバージョン、GET /metrics で処理時間と件数をPrometheusのテキスト形式
+    （/metrics?format=json ならJSON）で返す。
+    """
+
+    service = None
+
+    def send_json(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_text(self, status, text, content_type="text/plain; version=0.0.4; charset=utf-8"):
+        payload = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "graph_version": self.service.graph_version})
+        elif self.path == "/metrics":
+            self.send_text(200, get_default_metrics().to_prometheus())
+        elif self.path == "/metrics?format=json":
+            self.send_json(200, get_default_metrics().snapshot())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/recommend":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            query = json.loads(self.rfile.read(length) or b"{}")
+            ingredients = query["ingredients"]
+            if not isinstance(ingredients, list) or not ingredients:
+                raise ValueError("食材は非空のリストでなければなりません。")
+            result = self.service.recommend(ingredients, int(query.get("n", 5)), query.get("mode", "default"))
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        # リクエストごとのログは出力しない
+        pass
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    handler = type("Handler", (RecommendationRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    service.start_watching()
+    print(f"Serving recommendations on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="材料推薦サーバ")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--recipes", type=int, default=10000, help="グラフのレシピ数")
+    parser.add_argument("--translator", default="google", help="正規化バックエンド")
+    parser.add_argument("--dictionary", help="dictionary バックエンドの辞書ファイル")
+    parser.add_argument("--tokenizer", default="mecab", help="材料名の分かち書きに使うトークナイザ")
+    parser.add_argument("--community-algorithm", default="louvain", choices=COMMUNITY_ALGORITHMS,
+                        help="コミュニティ検出のアルゴリズム")
+    parser.add_argument("--cache-root", help="キャッシュのルートディレクトリ")
+    parser.add_argument("--reload-interval", type=float, default=30.0, help="キャッシュの更新を確認する間隔（秒）")
+    args = parser.parse_args()
+
+    translator_options = {"path": args.dictionary} if args.dictionary else None
+    started = time.perf_counter()
+    service = RecommendationService(args.recipes, args.translator, translator_options, args.cache_root,
+                                    reload_interval=args.reload_interval,
+                                    community_algorithm=args.community_algorithm, tokenizer=args.tokenizer)
+    print(f"Startup took {time.perf_counter() - started:.2f}s")
+    serve(service, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
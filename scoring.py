@@ -0,0 +1,162 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+class ScoringEngine:
+    """
+    CSR形式の隣接行列で推薦スコアを計算するエンジン。
+    クエリの行を疎行列の積でまとめて足し合わせ、コミュニティのマスクと中心性の重みを掛けてから
+    argpartition で上位k件を選ぶ。計算量はクエリの近傍の大きさに比例する。
+    """
+
+    def __init__(self, adjacency, communities, centrality):
+        # 重み付きの対称な隣接行列（自己ループは対角成分）
+        self.adjacency = sp.csr_matrix(adjacency)
+        # 共起の有無だけを表す隣接行列（共通の隣接ノードを数えるのに使う）
+        self.binary = sp.csr_matrix(
+            (np.ones_like(self.adjacency.data), self.adjacency.indices, self.adjacency.indptr),
+            shape=self.adjacency.shape)
+        # ノードID -> コミュニティID（コミュニティがない場合は -1）
+        self.communities = np.asarray(communities, dtype=np.int64)
+        # ノードID -> 中心性
+        self.centrality = np.asarray(centrality, dtype=np.float64)
+
+    @property
+    def number_of_nodes(self):
+        return self.adjacency.shape[0]
+
+    def query_matrix(self, id_lists):
+        """
+        ノードIDのリストのリストから、各行がクエリの出現回数を表す疎行列を作る。
+        """
+        rows = np.repeat(np.arange(len(id_lists)), [len(ids) for ids in id_lists])
+        cols = np.fromiter((index for ids in id_lists for index in ids), dtype=np.int64, count=len(rows))
+        return sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(id_lists), self.number_of_nodes))
+
+    def candidate_mask(self, query_ids, candidates):
+        # クエリと同じコミュニティに属し、クエリ自身ではない候補だけを残す
+        query_ids = np.asarray(query_ids, dtype=np.int64)
+        target_communities = np.unique(self.communities[query_ids])
+        return (np.isin(self.communities[candidates], target_communities)
+                & ~np.isin(candidates, query_ids))
+
+    @staticmethod
+    def top_k(candidates, scores, k):
+        """
+        スコアの上位k件を降順で返す。同点の場合はノードIDの小さい順。
+        """
+        positive = scores > 0
+        candidates, scores = candidates[positive], scores[positive]
+        if k <= 0 or len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if len(candidates) > k:
+            # k番目と同点の候補も残してから並べ替える
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = scores >= threshold
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))[:k]
+        return candidates[order], scores[order]
+
+    def score_neighbors(self, query_ids):
+        """
+        クエリの隣接ノードについて、エッジの重みの合計に中心性を掛けたスコアを計算する。
+        """
+        row = self.query_matrix([query_ids]) @ self.adjacency
+        candidates = row.indices.astype(np.int64)
+        scores = row.data * self.centrality[candidates]
+        mask = self.candidate_mask(query_ids, candidates)
+        return candidates[mask], scores[mask]
+
+    def recommend(self, query_ids, k):
+        """
+        GraphAnalyzer.recommend_ingredients と同じ順位付けで上位k件のノードIDを返す。
+        """
+        if len(query_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return self.top_k(*self.score_neighbors(query_ids), k)
+
+    def recommend_cooccurring(self, query_ids, k):
+        """
+        GraphAnalyzer.recommend_cooccurring_ingredients と同じ順位付けで上位k件のノードIDを返す。
+        すべての食材ペア (a, b) について共通の隣接ノード c に (w(a,c) + w(b,c)) * 中心性 を足す処理は、
+        c に隣接するクエリの数を K、その重みの合計を S とすると (K - 1) * S * 中心性 に等しいため、
+        ペアを列挙せずに1回の疎行列積で計算できる。
+        """
+        if len(query_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        query = self.query_matrix([query_ids])
+        weight_sums = query @ self.adjacency
+        neighbor_counts = query @ self.binary
+        # 2つの積は同じ非ゼロ構造を持つので、インデックスを揃えれば要素ごとに対応する
+        weight_sums.sort_indices()
+        neighbor_counts.sort_indices()
+
+        candidates = weight_sums.indices.astype(np.int64)
+        counts = neighbor_counts.data
+        common = counts >= 2
+        # 共通の隣接ノードが見つからない場合は、隣接ノードの重みと中心性だけで評価する
+        if not common.any():
+            return self.recommend(query_ids, k)
+
+        candidates = candidates[common]
+        scores = (counts[common] - 1) * weight_sums.data[common] * self.centrality[candidates]
+        mask = self.candidate_mask(query_ids, candidates)
+        return self.top_k(candidates[mask], scores[mask], k)
+
+    def top_k_per_row(self, rows, candidates, scores, k):
+        """
+        行ごとにスコアの上位k件を選ぶ。同点の場合はノードIDの小さい順。
+        """
+        positive = scores > 0
+        rows, candidates, scores = rows[positive], candidates[positive], scores[positive]
+        order = np.lexsort((candidates, -scores, rows))
+        rows, candidates, scores = rows[order], candidates[order], scores[order]
+        # 各行の先頭からの順位を求め、k件目までを残す
+        starts = np.searchsorted(rows, rows, side="left")
+        keep = (np.arange(len(rows)) - starts) < k
+        return rows[keep], candidates[keep], scores[keep]
+
+    def batch_candidate_mask(self, query, rows, candidates):
+        # 行ごとに、クエリと同じコミュニティに属し、クエリ自身ではない候補だけを残す
+        query = query.tocoo()
+        query_rows, query_ids = query.row.astype(np.int64), query.col.astype(np.int64)
+        number_of_communities = int(self.communities.max()) + 2 if len(self.communities) else 1
+        target_keys = query_rows * number_of_communities + (self.communities[query_ids] + 1)
+        candidate_keys = rows * number_of_communities + (self.communities[candidates] + 1)
+        input_keys = query_rows * self.number_of_nodes + query_ids
+        return (np.isin(candidate_keys, target_keys)
+                & ~np.isin(rows * self.number_of_nodes + candidates, input_keys))
+
+    def recommend_batch(self, id_lists, k, mode="default"):
+        """
+        複数のクエリをまとめて処理し、クエリごとの上位k件のノードIDのリストを返す。
+        全クエリの行を1つの疎行列にまとめ、隣接行列との1回の積でスコアを計算する。
+        mode に "cooccurring" を指定すると recommend_cooccurring と同じ順位付けになる。
+        """
+        if mode not in ("default", "cooccurring"):
+            raise ValueError(f"未知の推薦モードです: {mode}")
+        query = self.query_matrix(id_lists)
+        weight_sums = (query @ self.adjacency).tocsr()
+        weight_sums.sort_indices()
+        rows = np.repeat(np.arange(len(id_lists)), np.diff(weight_sums.indptr))
+        candidates = weight_sums.indices.astype(np.int64)
+        weights = weight_sums.data
+
+        if mode == "cooccurring":
+            neighbor_counts = (query @ self.binary).tocsr()
+            neighbor_counts.sort_indices()
+            counts = neighbor_counts.data
+            common = counts >= 2
+            # 共通の隣接ノードがあるクエリは共通の隣接ノードだけを (K - 1) 倍して評価し、
+            # ないクエリは recommend と同じ基準で評価する
+            has_common = np.bincount(rows[common], minlength=len(id_lists)) > 0
+            use_common = has_common[rows]
+            keep = ~use_common | common
+            weights = np.where(use_common, counts - 1, 1) * weights
+            rows, candidates, weights = rows[keep], candidates[keep], weights[keep]
+        scores = weights * self.centrality[candidates]
+
+        mask = self.batch_candidate_mask(query, rows, candidates)
+        rows, candidates, _ = self.top_k_per_row(rows[mask], candidates[mask], scores[mask], k)
+        boundaries = np.searchsorted(rows, np.arange(len(id_lists) + 1))
+        return [candidates[boundaries[i]:boundaries[i + 1]] for i in range(len(id_lists))]
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class SyntheticRecipe:
+    """
+    合成レシピ。Cookpadのレシピと同じく get_ingredients() で (材料名, 量) のリストを返す。
+    """
+
+    def __init__(self, recipe_id, ingredients):
+        self.recipe_id = recipe_id
+        self.ingredients = ingredients
+
+    def get_ingredients(self):
+        return [(name, "1") for name in self.ingredients]
+
+
+class SyntheticRecipeLoader:
+    """
+    材料の出現頻度がZipf分布に従う合成レシピを生成するローダー。
+    RecipeLoaderと同じく with 文と load_all_recipes() で使えるため、CreateGraph の recipe_loader に渡せる。
+    同じシードなら毎回同じレシピ列になる。
+    """
+
+    def __init__(self, number_of_recipes=10000, vocabulary_size=5000, min_ingredients=3, max_ingredients=12,
+                 zipf_exponent=1.1, seed=0, block_size=10000):
+        if not 1 <= min_ingredients <= max_ingredients:
+            raise ValueError("材料数は 1 <= min_ingredients <= max_ingredients でなければなりません。")
+        self.number_of_recipes = number_of_recipes
+        self.vocabulary_size = vocabulary_size
+        self.min_ingredients = min_ingredients
+        self.max_ingredients = max_ingredients
+        self.zipf_exponent = zipf_exponent
+        self.seed = seed
+        # 乱数をまとめて生成するレシピ数
+        self.block_size = block_size
+        ranks = np.arange(1, vocabulary_size + 1, dtype=np.float64)
+        weights = ranks ** -zipf_exponent
+        # 材料ID順の累積確率（searchsorted で材料をサンプリングする）
+        self.cumulative = np.cumsum(weights / weights.sum())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    @staticmethod
+    def ingredient_name(index):
+        return f"ingredient{index:06d}"
+
+    def sample_ingredient_ids(self, rng, size):
+        # Zipf分布に従う材料IDを size 個サンプリングする
+        ids = np.searchsorted(self.cumulative, rng.random(size), side="right")
+        return np.minimum(ids, self.vocabulary_size - 1)
+
+    def iter_ingredient_lists(self):
+        """
+        レシピごとの材料名のリストを順に返す。1レシピ内で重複した材料は1つにまとめる。
+        乱数は常に block_size 件単位で生成して最後のブロックだけ切り詰めるため、同じシードなら
+        レシピ数の少ない生成結果は多い生成結果の先頭と一致する（同じレシピIDは同じ材料になる）。
+        """
+        rng = np.random.default_rng(self.seed)
+        names = [self.ingredient_name(index) for index in range(self.vocabulary_size)]
+        remaining = self.number_of_recipes
+        while remaining > 0:
+            lengths = rng.integers(self.min_ingredients, self.max_ingredients + 1, size=self.block_size)
+            ids = self.sample_ingredient_ids(rng, int(lengths.sum())).tolist()
+            start = 0
+            for length in lengths[:remaining].tolist():
+                yield [names[index] for index in dict.fromkeys(ids[start:start + length])]
+                start += length
+            remaining -= min(self.block_size, remaining)
+
+    def load_all_recipes(self):
+        for recipe_id, ingredients in enumerate(self.iter_ingredient_lists()):
+            yield SyntheticRecipe(recipe_id, ingredients)
+
+    def sample_queries(self, number_of_queries, min_ingredients=1, max_ingredients=5, seed=None):
+        """
+        推薦の性能測定に使う、材料名のリストのクエリを生成する。材料はレシピと同じ分布に従う。
+        """
+        rng = np.random.default_rng(self.seed + 1 if seed is None else seed)
+        lengths = rng.integers(min_ingredients, max_ingredients + 1, size=number_of_queries)
+        ids = self.sample_ingredient_ids(rng, int(lengths.sum())).tolist()
+        queries = []
+        start = 0
+        for length in lengths.tolist():
+            queries.append([self.ingredient_name(index) for index in dict.fromkeys(ids[start:start + length])])
+            start += length
+        return queries
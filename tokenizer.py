@@ -0,0 +1,89 @@
+import os
+import threading
+
+
+class IngredientTokenizer:
+    """
+    MeCabで材料名から名詞を取り出すトークナイザ。
+    辞書の読み込みは重いため、Taggerはプロセスごとに1つだけ作って使い回す。
+    """
+
+    name = "mecab"
+    DEFAULT_DICTIONARY = "/usr/local/lib/mecab/dic/mecab-ipadic-neologd"
+
+    # (プロセスID, 辞書パス) ごとに共有するTagger
+    _taggers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, dictionary=DEFAULT_DICTIONARY):
+        self.dictionary = dictionary
+
+    @property
+    def tagger(self):
+        key = (os.getpid(), self.dictionary)
+        tagger = self._taggers.get(key)
+        if tagger is None:
+            with self._lock:
+                tagger = self._taggers.get(key)
+                if tagger is None:
+                    import MeCab
+                    tagger = MeCab.Tagger(f"-d {self.dictionary}" if self.dictionary else "")
+                    tagger.parse("")  # 初回呼び出しでの文字列解放バグを回避
+                    self._taggers[key] = tagger
+        return tagger
+
+    def extract_nouns(self, text):
+        """
+        文字列中の名詞を空白区切りで連結して返す。
+        """
+        return self.tokenize_many([text])[0]
+
+    def tokenize_many(self, texts):
+        """
+        複数の文字列をまとめて処理し、入力と同じ順序で名詞列を返す。
+        """
+        tagger = self.tagger
+        results = []
+        for text in texts:
+            nouns = []
+            node = tagger.parseToNode(text)
+            while node:
+                # 従来の「名詞」を含む行を拾う挙動と揃えるため、品詞情報全体で判定する
+                if node.surface and "名詞" in node.feature:
+                    nouns.append(node.surface)
+                node = node.next
+            results.append(" ".join(nouns))
+        return results
+
+
+class WhitespaceTokenizer:
+    """
+    空白で区切るだけのトークナイザ。MeCabなしでグラフ構築の性能を測るために使う。
+    """
+
+    name = "whitespace"
+
+    def extract_nouns(self, text):
+        return self.tokenize_many([text])[0]
+
+    def tokenize_many(self, texts):
+        return [" ".join(text.split()) for text in texts]
+
+
+TOKENIZERS = {
+    IngredientTokenizer.name: IngredientTokenizer,
+    WhitespaceTokenizer.name: WhitespaceTokenizer,
+}
+
+
+def create_tokenizer(name="mecab", **options):
+    """
+    名前とオプションからトークナイザを生成する。
+    """
+    if not isinstance(name, str):
+        return name
+    try:
+        tokenizer_class = TOKENIZERS[name]
+    except KeyError:
+        raise ValueError(f"未知のトークナイザです: {name} (選択肢: {', '.join(TOKENIZERS)})") from None
+    return tokenizer_class(**options)
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from cache_settings import default_cache_root
+
+
+class TranslationCache:
+    """
+    正規化済み材料名の永続キャッシュ。
+    クリーニング済みの日本語文字列をキーに、SQLite上へ翻訳結果を保存し、
+    プロセス内ではLRUを前段に置いてディスクアクセスを減らす。
+    """
+
+    def __init__(self, path=None, lru_size=8192):
+        self.path = path or os.path.join(default_cache_root(), "translations", "translations.sqlite3")
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        # ヒット・ミスのカウンタ
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # フォーク後のプロセスでは接続を作り直す
+        if self._conn is None or self._conn_pid != os.getpid():
+            dir_path = os.path.dirname(self.path)
+            if dir_path and not os.path.exists(dir_path):
+                os.makedirs(dir_path, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations (source TEXT PRIMARY KEY, result TEXT NOT NULL)")
+            self._conn.commit()
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, value):
+        self._lru[key] = value
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        """
+        キャッシュから正規化結果を取得する。存在しない場合はNoneを返す。
+        """
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return self._lru[key]
+
+            row = self._connection().execute(
+                "SELECT result FROM translations WHERE source = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.disk_hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key, value):
+        """
+        正規化結果をLRUとディスクの両方に保存する。
+        """
+        with self._lock:
+            self._remember(key, value)
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO translations (source, result) VALUES (?, ?)", (key, value))
+            conn.commit()
+
+    def put_many(self, items):
+        """
+        複数の (キー, 正規化結果) をまとめて保存する。ディスクへの書き込みは1回のコミットで済ませる。
+        """
+        items = list(items)
+        if not items:
+            return
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations (source, result) VALUES (?, ?)", items)
+            conn.commit()
+
+    def stats(self):
+        """
+        ヒット・ミスの集計を辞書で返す。
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._conn_pid = None
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    # プロセス内で共有する既定のキャッシュ
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TranslationCache()
+    return _default_cache
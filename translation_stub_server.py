@@ -0,0 +1,171 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from async_translation import TokenBucket
+
+
+class StubTranslationService:
+    """
+    翻訳APIの挙動を再現するスタブ。ネットワークなしで HttpTranslatorBackend の並行処理・レート制限・再試行を確かめるために使う。
+    - 各リクエストに latency 秒（±jitter）の遅延を入れる
+    - 1秒あたり rate_limit 件を超えたリクエストと、error_rate の確率で選んだリクエストに 429 を返す
+    - 翻訳結果は入力に prefix を付けた文字列
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, rate_limit=None, retry_after=None,
+                 prefix="", seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.prefix = prefix
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # サーバ側のレート制限（トークンが足りなければ待たずに429を返す）
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def admit(self):
+        # 受け付けるなら True、429を返すなら False
+        with self._lock:
+            self.requests += 1
+            throttled = self._random.random() < self.error_rate
+            if not throttled and self.bucket is not None:
+                throttled = not self.bucket.try_acquire()
+            if throttled:
+                self.throttled += 1
+            return not throttled
+
+    def translate(self, text):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        try:
+            time.sleep(delay)
+            return f"{self.prefix}{text}"
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "max_in_flight": self.max_in_flight}
+
+
+class StubTranslationRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /translate に {"q": "...", "source": "ja", "target": "en"} を送ると {"translatedText": "..."} を返す。
+    GET /stats でリクエスト数・429の数・最大同時リクエスト数を返す。
+    """
+
+    service = None
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_json(404, {"error": "not found"})
+            return
+        self.send_json(200, self.service.stats())
+
+    def do_POST(self):
+        if self.path != "/translate":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            text = json.loads(self.rfile.read(length) or b"{}")["q"]
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        if not self.service.admit():
+            headers = {"Retry-After": str(self.service.retry_after)} if self.service.retry_after is not None else None
+            self.send_json(429, {"error": "Too many requests"}, headers)
+            return
+        self.send_json(200, {"translatedText": self.service.translate(text)})
+
+    def log_message(self, format, *args):
+        # リクエストごとのログは出力しない
+        pass
+
+
+class StubTranslationServer:
+    """
+    スタブの翻訳サーバをバックグラウンドのスレッドで起動する。with文で使うと終了時に停止する。
+    port に0を指定すると空いているポートを使う。
+    """
+
+    def __init__(self, service=None, host="127.0.0.1", port=0):
+        self.service = service or StubTranslationService()
+        handler = type("Handler", (StubTranslationRequestHandler,), {"service": self.service})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/translate"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-translation", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="遅延と429を再現するスタブの翻訳サーバ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05, help="1リクエストの遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延のばらつき（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="ランダムに429を返す確率")
+    parser.add_argument("--rate-limit", type=float, help="1秒あたりに受け付けるリクエスト数")
+    parser.add_argument("--retry-after", type=float, help="429に付ける Retry-After（秒）")
+    parser.add_argument("--prefix", default="", help="翻訳結果の先頭に付ける文字列")
+    args = parser.parse_args()
+
+    service = StubTranslationService(args.latency, args.jitter, args.error_rate, args.rate_limit,
+                                     args.retry_after, args.prefix)
+    server = StubTranslationServer(service, args.host, args.port)
+    print(f"Serving stub translations on {server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+# 使い方:
+# python translation_stub_server.py --latency 0.2 --error-rate 0.1 --rate-limit 20
+# python main.py などで translator_backend="http", translator_options={"url": "http://127.0.0.1:5000/translate"}
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+# 並行に翻訳するバックエンドの、1秒あたりのリクエスト数の既定値
+DEFAULT_RATE = 5.0
+
+
+class TranslationError(Exception):
+    """
+    翻訳に失敗したことを表す例外。
+    失敗した材料はグラフの頂点にせず、呼び出し側で別途記録する。
+    """
+
+
+class RetryableTranslationError(TranslationError):
+    """
+    レート制限（HTTP 429）や一時的な通信エラーなど、時間をおけば成功する可能性がある翻訳の失敗。
+    retry_after にはサーバが指定した待ち時間（秒）が入る。
+    """
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TranslatorBackend:
+    """
+    翻訳バックエンドの基底クラス。
+    translate で1件、translate_many で複数件をまとめて翻訳する。
+    """
+
+    name = "base"
+    # 翻訳キャッシュに保存してよいかどうか
+    cacheable = True
+
+    @property
+    def cache_namespace(self):
+        # 同じ翻訳元を使うバックエンド同士でキャッシュを共有するための名前空間
+        return self.name
+
+    def translate(self, text):
+        raise NotImplementedError
+
+    def translate_many(self, texts):
+        """
+        複数の文字列を翻訳し、入力と同じ順序のリストで返す。失敗した要素はTranslationErrorになる。
+        """
+        results = []
+        for text in texts:
+            try:
+                results.append(self.translate(text))
+            except TranslationError as e:
+                results.append(e)
+        return results
+
+    def translate_ingredients(self, ingredients, parsed_texts):
+        """
+        クリーニング済みの材料名 ingredients と、それをトークナイズした parsed_texts を受け取って翻訳する。
+        既定ではトークナイズ後の文字列だけを翻訳する。
+        """
+        return self.translate_many(parsed_texts)
+
+    def metadata(self):
+        # キャッシュの整合性確認に使うバックエンドの情報
+        return {"name": self.name}
+
+    def take_stats(self):
+        # 前回呼び出してからの再試行などの件数（並行に翻訳するバックエンドだけが返す）
+        return {}
+
+
+class ConcurrentTranslatorBackend(TranslatorBackend):
+    """
+    translate_many で、1件ずつの translate を AsyncTranslationPipeline を使って並行に呼び出すバックエンドの基底クラス。
+    同時実行数・1秒あたりのリクエスト数・再試行の回数はオプションで指定する。
+    rate と burst はこのインスタンス（プロセス）での上限。
+    """
+
+    def __init__(self, concurrency=8, rate=DEFAULT_RATE, burst=None, max_retries=5, backoff=0.5, max_backoff=30.0):
+        self.pipeline_options = {
+            "concurrency": concurrency,
+            "rate": rate,
+            "burst": burst,
+            "max_retries": max_retries,
+            "backoff": backoff,
+            "max_backoff": max_backoff,
+        }
+        self._pipeline = None
+
+    @property
+    def pipeline(self):
+        # asyncioはレシピを翻訳するときだけ読み込む
+        if self._pipeline is None:
+            from async_translation import AsyncTranslationPipeline
+            self._pipeline = AsyncTranslationPipeline(self.translate, **self.pipeline_options)
+        return self._pipeline
+
+    def translate_many(self, texts):
+        return self.pipeline.run(texts)
+
+    def take_stats(self):
+        return self._pipeline.take_stats() if self._pipeline is not None else {}
+
+
+class GoogleTranslatorBackend(TranslatorBackend):
+    """
+    googletransを使って1件ずつ翻訳するバックエンド。
+    """
+
+    name = "google"
+
+    def __init__(self, src="ja", dest="en"):
+        self.src = src
+        self.dest = dest
+        self._translator = None
+
+    @property
+    def cache_namespace(self):
+        return f"google-{self.src}-{self.dest}"
+
+    @property
+    def translator(self):
+        # Translatorは使い回す（材料ごとに作り直さない）
+        if self._translator is None:
+            from googletrans import Translator
+            self._translator = Translator()
+        return self._translator
+
+    def translate(self, text):
+        try:
+            translation_result = self.translator.translate(text, src=self.src, dest=self.dest)
+        except Exception as e:
+            raise TranslationError(str(e)) from e
+        if not translation_result or not translation_result.text:
+            raise TranslationError("Translation not available")
+        return translation_result.text
+
+    def metadata(self):
+        # バッチ版も翻訳結果は同じなので、同じ情報を返す
+        return {"name": GoogleTranslatorBackend.name, "src": self.src, "dest": self.dest}
+
+
+class BatchGoogleTranslatorBackend(GoogleTranslatorBackend):
+    """
+    複数の文字列を改行でつないで1回のリクエストで翻訳し、結果を行ごとに分けるバックエンド。
+    （googletransにリストを渡しても内部で1件ずつリクエストするため、文字列を連結して送る）
+    - 1回のリクエストは batch_size 件・max_chars 文字まで
+    - 結果の行数が合わない場合はバッチを半分に分けて送り直す
+    - リクエストが失敗した場合はバッチ内の文字列をすべて失敗として返す（キャッシュされないので次回の構築で再試行される）
+    """
+
+    name = "google-batch"
+    SEPARATOR = "\n"
+
+    def __init__(self, src="ja", dest="en", batch_size=50, max_chars=4000):
+        super().__init__(src=src, dest=dest)
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+
+    def batches(self, texts):
+        # batch_size 件・max_chars 文字を超えないように区切る
+        batch, length = [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or length + len(text) + 1 > self.max_chars):
+                yield batch
+                batch, length = [], 0
+            batch.append(text)
+            length += len(text) + 1
+        if batch:
+            yield batch
+
+    def translate_batch(self, batch):
+        if len(batch) == 1:
+            try:
+                return [self.translate(batch[0])]
+            except TranslationError as e:
+                return [e]
+        try:
+            translation_result = self.translator.translate(self.SEPARATOR.join(batch), src=self.src, dest=self.dest)
+        except Exception as e:
+            error = TranslationError(str(e))
+            return [error] * len(batch)
+        lines = translation_result.text.split(self.SEPARATOR) if translation_result and translation_result.text else []
+        if len(lines) != len(batch):
+            # 改行がまとめられたり増えたりした場合は、半分ずつ送り直す
+            middle = len(batch) // 2
+            return self.translate_batch(batch[:middle]) + self.translate_batch(batch[middle:])
+        return [line.strip() if line.strip() else TranslationError("Translation not available") for line in lines]
+
+    def translate_many(self, texts):
+        # 文字列の中の改行は区切りと区別できないため空白に置き換える
+        texts = [" ".join(text.split(self.SEPARATOR)) for text in texts]
+        results = []
+        for batch in self.batches(texts):
+            results.extend(self.translate_batch(batch))
+        return results
+
+
+class AsyncGoogleTranslatorBackend(ConcurrentTranslatorBackend, GoogleTranslatorBackend):
+    """
+    googletransへのリクエストを並行に送るバックエンド。失敗はすべて一時的なものとみなして再試行する。
+    """
+
+    name = "google-async"
+
+    def __init__(self, src="ja", dest="en", **pipeline_options):
+        GoogleTranslatorBackend.__init__(self, src=src, dest=dest)
+        ConcurrentTranslatorBackend.__init__(self, **pipeline_options)
+        self._local = threading.local()
+
+    @property
+    def translator(self):
+        # Translatorはスレッドごとに作る
+        translator = getattr(self._local, "translator", None)
+        if translator is None:
+            from googletrans import Translator
+            translator = self._local.translator = Translator()
+        return translator
+
+    def translate(self, text):
+        try:
+            translation_result = self.translator.translate(text, src=self.src, dest=self.dest)
+        except Exception as e:
+            raise RetryableTranslationError(str(e)) from e
+        if not translation_result or not translation_result.text:
+            raise TranslationError("Translation not available")
+        return translation_result.text
+
+
+class HttpTranslatorBackend(ConcurrentTranslatorBackend):
+    """
+    LibreTranslate互換のHTTP API（POST {"q", "source", "target"} -> {"translatedText"}）で翻訳するバックエンド。
+    429と5xx、通信エラーは再試行し、それ以外のエラーは失敗として記録する。
+    """
+
+    name = "http"
+
+    def __init__(self, url, src="ja", dest="en", api_key=None, timeout=10.0, **pipeline_options):
+        super().__init__(**pipeline_options)
+        self.url = url
+        self.src = src
+        self.dest = dest
+        self.api_key = api_key
+        self.timeout = timeout
+
+    @property
+    def cache_namespace(self):
+        # 翻訳サービスごとに結果が異なるため、ホスト名も名前空間に含める
+        return f"http-{urlparse(self.url).netloc}-{self.src}-{self.dest}"
+
+    @staticmethod
+    def parse_retry_after(value):
+        try:
+            return max(float(value), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def translate(self, text):
+        from urllib.error import HTTPError, URLError
+        from urllib.request import Request, urlopen
+
+        body = {"q": text, "source": self.src, "target": self.dest, "format": "text"}
+        if self.api_key:
+            body["api_key"] = self.api_key
+        request = Request(self.url, data=json.dumps(body).encode("utf-8"),
+                          headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                result = json.loads(response.read().decode("utf-8"))
+        except HTTPError as e:
+            if e.code == 429 or e.code >= 500:
+                raise RetryableTranslationError(f"HTTP {e.code}", status=e.code,
+                                                retry_after=self.parse_retry_after(e.headers.get("Retry-After")))
+            raise TranslationError(f"HTTP {e.code}") from None
+        except (URLError, OSError) as e:
+            raise RetryableTranslationError(str(e)) from e
+        except ValueError as e:
+            raise TranslationError(f"Invalid response: {e}") from e
+
+        translated = result.get("translatedText") if isinstance(result, dict) else None
+        if not translated:
+            raise TranslationError("Translation not available")
+        return translated
+
+    def metadata(self):
+        return {"name": self.name, "url": self.url, "src": self.src, "dest": self.dest}
+
+
+class DictionaryTranslatorBackend(TranslatorBackend):
+    """
+    JSONまたはTSVの辞書を引くオフラインのバックエンド。
+    ネットワークに接続せずに再現性のあるグラフを構築するために使う。
+    辞書のキーには、カッコ以下を除いた材料名（「豚バラ肉」など）と、トークナイザの出力
+    （名詞を空白でつないだ「豚 バラ 肉」など）のどちらも使える。材料名で引き、なければトークナイズ後の文字列で引く。
+    """
+
+    name = "dictionary"
+    cacheable = False
+
+    def __init__(self, path):
+        self.path = path
+        self.table = self.load_dictionary(path)
+
+    @staticmethod
+    def load_dictionary(path):
+        # 拡張子が .json なら {日本語: 英語}、それ以外は「日本語<TAB>英語」の行として読み込む
+        if os.path.splitext(path)[1].lower() == ".json":
+            with open(path, encoding="utf-8") as f:
+                return dict(json.load(f))
+
+        table = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.reader(f, delimiter="\t"):
+                if len(row) >= 2 and row[0] and not row[0].startswith("#"):
+                    table[row[0]] = row[1]
+        return table
+
+    def translate(self, text):
+        try:
+            return self.table[text]
+        except KeyError:
+            raise TranslationError(f"'{text}' is not in dictionary {self.path}") from None
+
+    def translate_ingredients(self, ingredients, parsed_texts):
+        results = []
+        for ingredient, text in zip(ingredients, parsed_texts):
+            if ingredient in self.table:
+                results.append(self.table[ingredient])
+                continue
+            try:
+                results.append(self.translate(text))
+            except TranslationError as e:
+                results.append(e)
+        return results
+
+    def metadata(self):
+        # 辞書の内容が変わったらキャッシュを作り直せるよう、ファイルのハッシュも含める
+        with open(self.path, mode="rb") as f:
+            checksum = hashlib.sha1(f.read()).hexdigest()
+        return {"name": self.name, "path": os.path.abspath(self.path), "entries": len(self.table),
+                "sha1": checksum}
+
+
+class IdentityTranslatorBackend(TranslatorBackend):
+    """
+    入力をそのまま返すバックエンド。ネットワークや辞書なしでグラフ構築の性能を測るために使う。
+    """
+
+    name = "identity"
+    cacheable = False
+
+    def translate(self, text):
+        if not text:
+            raise TranslationError("Empty ingredient name")
+        return text
+
+    def translate_many(self, texts):
+        return [text if text else TranslationError("Empty ingredient name") for text in texts]
+
+
+TRANSLATOR_BACKENDS = {
+    GoogleTranslatorBackend.name: GoogleTranslatorBackend,
+    BatchGoogleTranslatorBackend.name: BatchGoogleTranslatorBackend,
+    AsyncGoogleTranslatorBackend.name: AsyncGoogleTranslatorBackend,
+    HttpTranslatorBackend.name: HttpTranslatorBackend,
+    DictionaryTranslatorBackend.name: DictionaryTranslatorBackend,
+    IdentityTranslatorBackend.name: IdentityTranslatorBackend,
+}
+
+
+def create_translator_backend(name="google", **options):
+    """
+    名前とオプションから翻訳バックエンドを生成する。
+    """
+    if isinstance(name, TranslatorBackend):
+        return name
+    try:
+        backend_class = TRANSLATOR_BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"未知の翻訳バックエンドです: {name} (選択肢: {', '.join(TRANSLATOR_BACKENDS)})") from None
+    return backend_class(**options)
+
+
+def per_process_options(name, options, processes):
+    """
+    processes 個のプロセスでそれぞれバックエンドを作るときのオプション。
+    並行に翻訳するバックエンドでは rate と burst を等分し、全プロセスの合計が指定した上限を超えないようにする。
+    インスタンスを渡した場合はそのまま使うため、rate はプロセスごとの上限になる。
+    """
+    backend_class = TRANSLATOR_BACKENDS.get(name) if isinstance(name, str) else None
+    if processes <= 1 or backend_class is None or not issubclass(backend_class, ConcurrentTranslatorBackend):
+        return options
+    options = dict(options)
+    options["rate"] = options.get("rate", DEFAULT_RATE) / processes
+    if options.get("burst") is not None:
+        # 1未満ではトークンが溜まらず、いつまでも待ち続ける
+        options["burst"] = max(options["burst"] / processes, 1.0)
+    return options
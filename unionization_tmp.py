@@ -1,17 +1,47 @@
-from googletrans import Translator
-import MeCab
-from cookpad.recipe_loader import RecipeLoader
+from translation_cache import get_default_cache
+from translator_backends import TranslationError, create_translator_backend
+from tokenizer import IngredientTokenizer
+from metrics import get_default_metrics
 
 class Unionization:
+    def __init__(self, cache=None, backend=None, tokenizer=None, metrics=None):
+        # 正規化結果の永続キャッシュ（指定がなければプロセス共有の既定キャッシュ）
+        self.cache = cache if cache is not None else get_default_cache()
+        # 翻訳バックエンド（指定がなければgoogletrans）
+        self.backend = create_translator_backend(backend or "google")
+        # MeCabのトークナイザ（Taggerはプロセス内で共有される）
+        self.tokenizer = tokenizer or IngredientTokenizer()
+        # 翻訳に失敗した材料と理由（グラフには追加しない）
+        self.failures = {}
+        # 形態素解析と翻訳の時間・件数
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+
     def translate_given_ingredients(self, ingredients):
-        translated_ingredients_list = []  # 翻訳された材料を格納するリスト
-        for ingredient, quantity in ingredients:
-            cleaned_ingredient = self.clean_ingredient(ingredient)
-            if cleaned_ingredient:
-                translated_ingredient_name = self.process_ingredient(cleaned_ingredient)
-                # 翻訳された材料の名前と元の量をタプルとしてリストに追加
-                translated_ingredients_list.append((translated_ingredient_name, quantity))
-        return translated_ingredients_list
+        return self.translate_recipes([ingredients])[0]
+
+    def translate_recipes(self, ingredient_lists):
+        """
+        複数レシピの材料リストをまとめて正規化する。
+        重複する材料は1度だけトークナイズ・翻訳し、レシピごとの (材料名, 量) のリストを返す。
+        """
+        cleaned_lists = [[(self.clean_ingredient(ingredient), quantity) for ingredient, quantity in ingredients]
+                         for ingredients in ingredient_lists]
+        # 未翻訳の材料はバックエンドにまとめて問い合わせる
+        translations = self.process_ingredients(
+            [name for cleaned_ingredients in cleaned_lists for name, _ in cleaned_ingredients if name])
+
+        results = []
+        for cleaned_ingredients in cleaned_lists:
+            translated_ingredients_list = []  # 翻訳された材料を格納するリスト
+            for cleaned_ingredient, quantity in cleaned_ingredients:
+                if cleaned_ingredient:
+                    translated_ingredient_name = translations.get(cleaned_ingredient)
+                    if translated_ingredient_name is None:
+                        continue  # 翻訳に失敗した材料はスキップ
+                    # 翻訳された材料の名前と元の量をタプルとしてリストに追加
+                    translated_ingredients_list.append((translated_ingredient_name, quantity))
+            results.append(translated_ingredients_list)
+        return results
 
     def clean_ingredient(self, ingredient): #カッコ以下を消す
         for char in ["（", "("]:
@@ -19,36 +49,61 @@ class Unionization:
                 return ingredient.split(char)[0].strip()
         return ingredient
 
+    def cache_key(self, ingredient):
+        # バックエンドとトークナイザごとに翻訳結果が異なるため名前空間を付ける
+        # （MeCabの結果は以前のキャッシュをそのまま使えるよう、トークナイザ名を付けない）
+        tokenizer_name = getattr(self.tokenizer, "name", type(self.tokenizer).__name__)
+        if tokenizer_name == IngredientTokenizer.name:
+            return f"{self.backend.cache_namespace}:{ingredient}"
+        return f"{self.backend.cache_namespace}:{tokenizer_name}:{ingredient}"
+
     def process_ingredient(self, ingredient): #Mecabと翻訳処理
-        parsed_text = self.mecab_parse(ingredient)
-        translated_text = self.translate(parsed_text)
-        translated_text_lower = translated_text.lower().replace('\u200b', '')  # 英語の出力をすべて小文字にし、ゼロ幅スペースを削除
-        return translated_text_lower
+        # 翻訳に失敗した場合はNoneを返す（理由は self.failures に記録）
+        return self.process_ingredients([ingredient]).get(ingredient)
 
-    def mecab_parse(self, text): #Mecab
-        mc = MeCab.Tagger('-d /usr/local/lib/mecab/dic/mecab-ipadic-neologd')
-        mc.parse('')
-        node = mc.parse(text)
-        nouns = []
+    @staticmethod
+    def normalize_translation(text):
+        # 英語の出力をすべて小文字にし、ゼロ幅スペースを削除
+        return text.lower().replace('\u200b', '')
 
-        for line in node.split('\n'):
-            if "名詞" in line:
-                noun = line.split('\t')[0]
-                if noun:
-                    nouns.append(noun)
+    def process_ingredients(self, ingredients):
+        """
+        複数の材料をまとめて正規化し、{材料: 正規化結果} の辞書を返す。失敗した材料は含まれない。
+        """
+        results = {}
+        pending = []
+        for ingredient in dict.fromkeys(ingredients):
+            cached = self.cache.get(self.cache_key(ingredient)) if self.backend.cacheable else None
+            if cached is not None:
+                results[ingredient] = cached
+            else:
+                pending.append(ingredient)
+
+        if pending:
+            with self.metrics.stage("normalize.tokenize"):
+                parsed_texts = self.tokenizer.tokenize_many(pending)
+            with self.metrics.stage("normalize.translate"):
+                translations = self.backend.translate_ingredients(pending, parsed_texts)
+            self.metrics.increment("translation_requests", len(pending))
+            # 並行に翻訳するバックエンドの再試行・レート制限の件数
+            for name, value in self.backend.take_stats().items():
+                self.metrics.increment(f"translation_backend_{name}", value)
+            translated_items = []
+            for ingredient, translated in zip(pending, translations):
+                if isinstance(translated, TranslationError):
+                    self.failures[ingredient] = str(translated)
+                    self.metrics.increment("translation_failures")
+                    continue
+                results[ingredient] = self.normalize_translation(translated)
+                translated_items.append((self.cache_key(ingredient), results[ingredient]))
+            # 翻訳結果はバッチごとに1回のコミットでキャッシュに保存する
+            if self.backend.cacheable:
+                self.cache.put_many(translated_items)
+        return results
 
-        return " ".join(nouns)
+    def mecab_parse(self, text): #Mecab
+        return self.tokenizer.extract_nouns(text)
 
     def translate(self, text): #翻訳
-        translator = Translator()
-        text_ja = text
-        try:
-            translation_result = translator.translate(text_ja, src='ja', dest='en')
-            if translation_result:
-                text_en = translation_result.text
-            else:
-                text_en = "Translation not available"  # 翻訳結果がない場合に代替のメッセージを表示
-        except Exception as e:
-            print(f"Translation error: {e}")
-            text_en = "Translation error"  # エラーが発生した場合に代替のメッセージを表示
-        return text_en
+        # 失敗した場合は TranslationError を送出する
+        return self.backend.translate(text)